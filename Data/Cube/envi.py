@@ -0,0 +1,183 @@
+import os
+import re
+
+import numpy as np
+
+from ..cache import LRUCache
+from ..profiler import profiler
+
+# Типы данных ENVI (поле 'data type' заголовка)
+ENVI_DTYPES = {
+    1: np.uint8, 2: np.int16, 3: np.int32, 4: np.float32, 5: np.float64,
+    12: np.uint16, 13: np.uint32, 14: np.int64, 15: np.uint64,
+}
+
+# Порядок осей файла для каждого способа чередования (interleave)
+INTERLEAVES = {
+    'bsq': ('bands', 'lines', 'samples'),
+    'bil': ('lines', 'bands', 'samples'),
+    'bip': ('lines', 'samples', 'bands'),
+}
+
+# Расширения, под которыми может лежать файл с данными
+RAW_EXTENSIONS = ('', '.raw', '.img', '.dat', '.bsq', '.bil', '.bip')
+
+def read_header(path: str) -> dict[str, str | list[str]]:
+    # Разбор заголовка .hdr: 'ключ = значение', значения в {} могут быть многострочными
+    with open(path, encoding='utf-8', errors='replace') as file:
+        text = file.read()
+
+    if not text.lstrip().startswith('ENVI'):
+        raise ValueError(f'Файл {path} не является заголовком ENVI')
+
+    header = {}
+    for match in re.finditer(r'^\s*([^=\n]+?)\s*=\s*(\{[^}]*\}|[^\n]*)', text, re.MULTILINE):
+        key, value = match.group(1).strip().lower(), match.group(2).strip()
+        if value.startswith('{'):
+            value = [item.strip() for item in value[1:-1].split(',') if item.strip()]
+        header[key] = value
+    return header
+
+def write_header(path: str, header: dict[str, object]):
+    # Запись заголовка .hdr (списки записываются в {})
+    lines = ['ENVI']
+    for key, value in header.items():
+        if isinstance(value, (list, tuple, np.ndarray)):
+            value = '{' + ', '.join(map(str, value)) + '}'
+        lines.append(f'{key} = {value}')
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+
+def find_raw(path: str) -> str:
+    # Поиск файла с данными рядом с заголовком
+    base = os.path.splitext(path)[0]
+    for ext in RAW_EXTENSIONS:
+        for candidate in (base + ext, base + ext.upper()):
+            if os.path.isfile(candidate) and candidate != path:
+                return candidate
+    raise FileNotFoundError(f'Не найден файл данных для {path}')
+
+class EnviCube:
+    # Куб ENVI, отображенный в память: каналы и пиксели читаются с диска только при обращении
+    CACHE_BYTES = 512 * 2**20 # Бюджет кэша каналов по умолчанию
+
+    def __init__(self, path: str, cache_bytes: int | None = None, mode: str = 'r'):
+        self.header = read_header(path)
+        self.path = find_raw(path)
+        self.cache = LRUCache(max_bytes=self.CACHE_BYTES if cache_bytes is None else cache_bytes)
+
+        shape = tuple(self.size[axis] for axis in INTERLEAVES[self.interleave])
+        self._raw: np.memmap = np.memmap(self.path, dtype=self.dtype, mode=mode,
+                                         offset=self.offset, shape=shape)
+
+    @classmethod
+    def create(cls, path: str, shape: tuple[int, int, int], dtype: np.dtype = np.float32,
+               interleave: str = 'bil', wavelengths: np.ndarray | None = None, **kwargs) -> 'EnviCube':
+        # Создание пустого куба ENVI (lines, samples, bands) на диске, открытого для записи
+        lines, samples, bands = shape
+        dtype = np.dtype(dtype)
+        header = {'samples': samples, 'lines': lines, 'bands': bands, 'header offset': 0,
+                  'file type': 'ENVI Standard', 'interleave': interleave,
+                  'data type': {np.dtype(value): key for key, value in ENVI_DTYPES.items()}[dtype.newbyteorder('=')],
+                  'byte order': int(dtype.byteorder == '>')}
+        if wavelengths is not None: header['wavelength'] = list(wavelengths)
+
+        base = os.path.splitext(path)[0]
+        write_header(base + '.hdr', header)
+        raw_shape = tuple({'lines': lines, 'samples': samples, 'bands': bands}[axis] for axis in INTERLEAVES[interleave])
+        np.memmap(base + '.raw', dtype=dtype, mode='w+', shape=raw_shape).flush()
+        return cls(base + '.hdr', mode='r+', **kwargs)
+
+    @property
+    def size(self) -> dict[str, int]:
+        return {axis: int(self.header[axis]) for axis in ('lines', 'samples', 'bands')}
+
+    @property
+    def interleave(self) -> str:
+        interleave = self.header.get('interleave', 'bsq').lower()
+        if interleave not in INTERLEAVES: raise ValueError(f'Неизвестный interleave: {interleave}')
+        return interleave
+
+    @property
+    def dtype(self) -> np.dtype:
+        dtype = np.dtype(ENVI_DTYPES[int(self.header['data type'])])
+        byte_order = int(self.header.get('byte order', 0))
+        return dtype.newbyteorder('>' if byte_order else '<')
+
+    @property
+    def offset(self) -> int:
+        return int(self.header.get('header offset', 0))
+
+    @property
+    def raw(self) -> np.memmap:
+        # Данные в порядке осей файла
+        return self._raw
+
+    @property
+    def data(self) -> np.ndarray:
+        # Представление (lines, samples, bands) без копирования
+        axes = INTERLEAVES[self.interleave]
+        return self._raw.transpose([axes.index(axis) for axis in ('lines', 'samples', 'bands')])
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.data.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self._raw.nbytes
+
+    @property
+    def wavelengths(self) -> np.ndarray[float] | None:
+        if 'wavelength' not in self.header: return None
+        return np.array(self.header['wavelength'], dtype=float)
+
+    @property
+    def float_dtype(self) -> np.dtype:
+        # Тип, в котором каналы отдаются наружу (целочисленные данные -> float32)
+        dtype = self.dtype
+        return np.dtype(dtype.name if dtype.kind == 'f' else np.float32)
+
+    def band(self, b: int) -> np.ndarray:
+        # Представление одного канала (lines, samples)
+        return self.data[:, :, b]
+
+    @profiler.timed('read_bands')
+    def read_bands(self, indices: list[int], rows: slice = slice(None)) -> np.ndarray:
+        # Чтение каналов (в строках rows) одним проходом в порядке чередования файла
+        # -> (len(indices), lines, samples)
+        match self.interleave:
+            case 'bsq': # каждый канал - непрерывный блок
+                lines = len(range(*rows.indices(self.shape[0])))
+                out = np.empty((len(indices), lines, self.shape[1]), dtype=self.float_dtype)
+                for i, b in enumerate(indices):
+                    out[i] = self._raw[b, rows]
+            case 'bil': # строки каналов с шагом bands * samples
+                out = np.ascontiguousarray(np.moveaxis(self._raw[rows, indices, :], 1, 0), dtype=self.float_dtype)
+            case 'bip': # значения каналов с шагом bands
+                out = np.ascontiguousarray(np.moveaxis(self._raw[rows][:, :, indices], 2, 0), dtype=self.float_dtype)
+        profiler.count_bytes('read_bands', out.size * self.dtype.itemsize) # Прочитано с диска
+        return out
+
+    def bands(self, indices: list[int], prefetch: list[int] = ()) -> list[np.ndarray]:
+        # Каналы по требованию: читаются только отсутствующие в кэше
+        # prefetch - каналы, которые выгодно прочитать тем же проходом (напр. для RGB)
+        cached = {b: self.cache.get(b) for b in set(indices)}
+        missing = [b for b, band in cached.items() if band is None]
+        if missing:
+            missing += [b for b in set(prefetch) if b not in self.cache and b not in missing]
+            for b, band in zip(missing, self.read_bands(missing)):
+                self.cache[b] = band
+                if b in cached: cached[b] = band
+        return [cached[b] for b in indices]
+
+    def spectre(self, y: int, x: int) -> np.ndarray:
+        # Спектр одного пикселя
+        return self.data[y, x, :]
+
+def main():
+    cube = EnviCube('test_data/tobacco.hdr')
+    print(cube.interleave, cube.shape, cube.dtype)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+from collections.abc import Callable, Hashable
+
+import numpy as np
+
+from .tiles import row_tiles
+from ..progress import Progress
+
+class SummedArea:
+    # Интегральные изображения (summed-area tables) по каждому каналу куба с маской и по самой маске:
+    # сумма и число пикселей маски в любом прямоугольнике - четыре обращения к таблице
+
+    def __init__(self, region: Callable[[slice], np.ndarray], mask: np.ndarray[bool], bands: int,
+                 rows: int = 64, key: Hashable = None, allocate: Callable[..., np.ndarray] | None = None):
+        # region(rows) - полоса куба (rows, samples, bands), allocate(shape, dtype) - выделение таблицы
+        # (напр. файл, отображенный в память, для больших кубов)
+        self.key = key
+        height, width = mask.shape
+        allocate = allocate or (lambda shape, dtype: np.empty(shape, dtype=dtype))
+
+        self.sums = allocate((height + 1, width + 1, bands), np.float64)
+        self.sums[0] = 0
+        self.sums[:, 0] = 0
+        self.counts = np.zeros((height + 1, width + 1), dtype=np.int64)
+        self.counts[1:, 1:] = mask.cumsum(axis=0).cumsum(axis=1)
+
+        tiles = row_tiles(height, rows)
+        for done, tile in enumerate(tiles, 1):
+            data = np.where(mask[tile, :, None], region(tile), 0).astype(np.float64)
+            data = data.cumsum(axis=1).cumsum(axis=0)
+            data += self.sums[tile.start, 1:]
+            self.sums[tile.start + 1:tile.stop + 1, 1:] = data
+            Progress.report(done, len(tiles))
+
+    @staticmethod
+    def nbytes(height: int, width: int, bands: int) -> int:
+        return (height + 1) * (width + 1) * (bands * 8 + 8)
+
+    def sum(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray[float]:
+        # Сумма спектров пикселей маски в [x0, x1) x [y0, y1)
+        s = self.sums
+        return s[y1, x1] - s[y0, x1] - s[y1, x0] + s[y0, x0]
+
+    def count(self, x0: int, y0: int, x1: int, y1: int) -> int:
+        c = self.counts
+        return int(c[y1, x1] - c[y0, x1] - c[y1, x0] + c[y0, x0])
+
+    def mean(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray[float]:
+        # Средний спектр по пикселям маски (фон не учитывается), без пикселей маски - нули
+        count = self.count(x0, y0, x1, y1)
+        total = self.sum(x0, y0, x1, y1)
+        return total / count if count else np.zeros_like(total)
@@ -0,0 +1,58 @@
+import numpy as np
+
+class Orientation:
+    # Виртуальная ориентация изображения: отражение (по горизонтали) и затем поворот на k*90° как в np.rot90
+    # Данные остаются в исходной раскладке, преобразуются только 2D-результаты и координаты
+
+    def __init__(self, k: int = 0, flipped: bool = False):
+        self.k = k % 4
+        self.flipped = flipped
+
+    def rotate(self, k: int = 1):
+        self.k = (self.k + k) % 4
+
+    def flip(self):
+        # Отражение по горизонтали уже повернутого изображения: fliplr(rot90(img, k)) = rot90(fliplr(img), -k)
+        self.k = -self.k % 4
+        self.flipped = not self.flipped
+
+    ########################################
+
+    def apply(self, img: np.ndarray) -> np.ndarray:
+        # Исходная раскладка -> отображаемая (представление без копирования, оси 0 и 1)
+        if img is None: return None
+        if self.flipped: img = img[:, ::-1]
+        return np.rot90(img, k=self.k)
+
+    def invert(self, img: np.ndarray) -> np.ndarray:
+        # Отображаемая раскладка -> исходная (представление без копирования)
+        if img is None: return None
+        img = np.rot90(img, k=-self.k)
+        return img[:, ::-1] if self.flipped else img
+
+    def shape(self, shape: tuple[int, ...]) -> tuple[int, ...]:
+        # Размер изображения после ориентации
+        h, w, *rest = shape
+        return (w, h, *rest) if self.k % 2 else (h, w, *rest)
+
+    ########################################
+
+    def to_native(self, y: int | np.ndarray, x: int | np.ndarray, shape: tuple[int, ...]) -> tuple:
+        # Координаты пикселя на экране -> координаты в исходной раскладке (shape - исходный размер)
+        h, w = shape[:2]
+        for step in range(self.k, 0, -1):
+            # rot90: out[i, j] = in[j, w_in - 1 - i], w_in - ширина до этого шага поворота
+            w_in = w if step % 2 else h
+            y, x = x, w_in - 1 - y
+        if self.flipped: x = w - 1 - x
+        return y, x
+
+    def box_to_native(self, x0: int, y0: int, x1: int, y1: int, shape: tuple[int, ...]) -> tuple[int, int, int, int]:
+        # Прямоугольник [x0, x1) x [y0, y1) на экране -> прямоугольник в исходной раскладке
+        if x0 >= x1 or y0 >= y1: return 0, 0, 0, 0
+        ya, xa = self.to_native(y0, x0, shape)
+        yb, xb = self.to_native(y1 - 1, x1 - 1, shape)
+        return min(xa, xb), min(ya, yb), max(xa, xb) + 1, max(ya, yb) + 1
+
+    def __repr__(self):
+        return f'Orientation(k={self.k}, flipped={self.flipped})'
@@ -0,0 +1,254 @@
+from abc import ABC, abstractmethod
+from itertools import count
+from collections.abc import Callable, Hashable
+
+import numpy as np
+
+from ..cache import LRUCache
+from ..profiler import profiler
+from .savgol import SavGol
+
+class Step(ABC):
+    # Операция ленивого конвейера над кубом (lines, samples, bands) в исходной раскладке
+    # band - вычислить выходной канал b по каналам предыдущего шага (get, всего их bands),
+    # inputs - какие каналы предыдущего шага для этого нужны,
+    # region - вычислить область (rows, cols, bands) по области предыдущего шага
+    name = 'step'
+
+    @property
+    def key(self) -> Hashable:
+        return (self.name,)
+
+    def band_count(self, bands: int) -> int:
+        return bands
+
+    def wavelengths(self, wave: np.ndarray) -> np.ndarray:
+        return wave
+
+    def inputs(self, b: int, bands: int) -> list[int]:
+        return [b]
+
+    @abstractmethod
+    def band(self, b: int, get: Callable[[int], np.ndarray], bands: int) -> np.ndarray:
+        pass
+
+    @abstractmethod
+    def region(self, data: np.ndarray, rows: slice, cols: slice) -> np.ndarray:
+        pass
+
+    def __repr__(self):
+        return f'{type(self).__name__}{self.key[1:]}'
+
+class Linear(Step):
+    # Линейная операция над спектром: out = M @ spectre, M - (выходные каналы, входные каналы)
+    @abstractmethod
+    def matrix(self, bands: int) -> np.ndarray[float]:
+        pass
+
+    def weights(self, bands: int) -> np.ndarray[float]:
+        if getattr(self, '_bands', None) != bands:
+            self._bands, self._matrix = bands, self.matrix(bands)
+        return self._matrix
+
+    def band_count(self, bands: int) -> int:
+        return self.weights(bands).shape[0]
+
+    def inputs(self, b: int, bands: int) -> list[int]:
+        # Только каналы с ненулевым весом (для сглаживания - окно вокруг b)
+        return np.flatnonzero(self.weights(bands)[b]).tolist()
+
+    def band(self, b: int, get: Callable[[int], np.ndarray], bands: int) -> np.ndarray:
+        row = self.weights(bands)[b]
+        out = None
+        for j in np.flatnonzero(row):
+            term = get(j) * np.float32(row[j])
+            out = term if out is None else np.add(out, term, out=out)
+        return out
+
+    def region(self, data: np.ndarray, rows: slice, cols: slice) -> np.ndarray:
+        return data @ self.weights(data.shape[-1]).T.astype(data.dtype)
+
+class Smooth(Linear):
+    # Сглаживание спектров фильтром Савицкого-Голея (mask - только пиксели маски)
+    name = 'smooth'
+    _unkeyed = count() # Номера масок без ключа: результат с такой маской не совпадет ни с каким другим
+
+    def __init__(self, window_length: int = 5, polyorder: int = 2, deriv: int = 0,
+                 mask: np.ndarray[bool] | None = None, mask_key: Hashable = None):
+        self.savgol = SavGol(window_length, polyorder, deriv)
+        if mask is not None and mask_key is None: mask_key = ('unkeyed', next(self._unkeyed))
+        self.mask, self.mask_key = mask, mask_key
+
+    @property
+    def key(self) -> Hashable:
+        return (self.name, *self.savgol.params, self.mask_key if self.mask is not None else None)
+
+    def matrix(self, bands: int) -> np.ndarray[float]:
+        return self.savgol.matrix(bands)
+
+    def inputs(self, b: int, bands: int) -> list[int]:
+        inputs = super().inputs(b, bands)
+        return inputs if self.mask is None or b in inputs else inputs + [b] # Вне маски - исходный канал
+
+    def band(self, b: int, get: Callable[[int], np.ndarray], bands: int) -> np.ndarray:
+        band = super().band(b, get, bands)
+        return band if self.mask is None else np.where(self.mask, band, get(b))
+
+    def region(self, data: np.ndarray, rows: slice, cols: slice) -> np.ndarray:
+        return self.savgol(data, mask=None if self.mask is None else self.mask[rows, cols])
+
+class Pipeline:
+    # Ленивый конвейер операций над кубом: цепочка только записывается, а вычисляется
+    # для тех каналов или областей, которые запрошены. Промежуточные каналы каждого префикса
+    # цепочки кэшируются (с бюджетом памяти), поэтому выключение шага или возврат к прежней
+    # цепочке не требует пересчета.
+    # Поворот и маска в конвейер не входят: поворот - виртуальная ориентация (Orientation), маска хранится
+    # отдельно и применяется при обращении. Шаги, меняющие число каналов (выбор каналов, спектральное
+    # прореживание), не поддерживаются: номера каналов в выражениях, RGB_BANDS и подписи в нм
+    # привязаны к каналам файла
+    CACHE_BYTES = 512 * 2**20
+
+    def __init__(self, source_bands: Callable[[list[int]], list[np.ndarray]],
+                 source_region: Callable[[slice, slice], np.ndarray], bands: int,
+                 cache_bytes: int | None = None):
+        self.source_bands = source_bands # Чтение исходных каналов (lines, samples)
+        self.source_region = source_region # Чтение исходной области (rows, cols, bands)
+        self.source_count = bands
+        self.steps: list[Step] = []
+        self.cache = LRUCache(max_bytes=self.CACHE_BYTES if cache_bytes is None else cache_bytes)
+
+    ########################################
+
+    def add(self, step: Step, index: int | None = None):
+        self.steps.insert(len(self.steps) if index is None else index, step)
+
+    def remove(self, name: str) -> Step | None:
+        # Удалить шаг по имени (напр. 'smooth')
+        for step in self.steps:
+            if step.name == name:
+                self.steps.remove(step)
+                return step
+        return None
+
+    def replace(self, step: Step):
+        # Заменить шаг того же типа на новый (или добавить в конец)
+        for i, current in enumerate(self.steps):
+            if current.name == step.name:
+                self.steps[i] = step
+                return
+        self.add(step)
+
+    def clear(self):
+        self.steps.clear()
+        self.cache.clear()
+
+    ########################################
+
+    def key(self, level: int | None = None) -> tuple:
+        # Ключ цепочки из первых level шагов
+        steps = self.steps if level is None else self.steps[:level]
+        return tuple(step.key for step in steps)
+
+    def band_count(self, level: int | None = None) -> int:
+        count = self.source_count
+        for step in (self.steps if level is None else self.steps[:level]):
+            count = step.band_count(count)
+        return count
+
+    def wavelengths(self, wave: np.ndarray) -> np.ndarray:
+        for step in self.steps:
+            wave = step.wavelengths(wave)
+        return wave
+
+    ########################################
+
+    def inputs(self, indices: list[int], level: int) -> dict[int, np.ndarray]:
+        # Каналы indices после первых level шагов; исходные каналы читаются одним проходом по файлу
+        indices = list(dict.fromkeys(indices))
+        if level == 0: return dict(zip(indices, self.source_bands(indices)))
+        return {j: self.band(j, level) for j in indices}
+
+    def band(self, b: int, level: int | None = None, inputs: dict[int, np.ndarray] | None = None) -> np.ndarray:
+        # Канал b после первых level шагов (inputs - уже полученные каналы предыдущего шага)
+        level = len(self.steps) if level is None else level
+        if level == 0: return self.source_bands([b])[0]
+
+        key = ('band', self.key(level), b)
+        band = self.cache.get(key)
+        if band is None:
+            step, count = self.steps[level - 1], self.band_count(level - 1)
+            if inputs is None: inputs = self.inputs(step.inputs(b, count), level - 1)
+            with profiler.timer(f'pipeline.{step.name}'): # Время самого шага, без получения входных каналов
+                band = step.band(b, inputs.__getitem__, count)
+            self.cache[key] = band
+        return band
+
+    def bands(self, indices: list[int]) -> list[np.ndarray]:
+        if not self.steps: return self.source_bands(indices)
+        # Входы всех еще не вычисленных каналов последнего шага - одним запросом
+        # Уже вычисленные каналы забираются из кэша до расчета остальных: расчет может их вытеснить
+        level, key = len(self.steps), self.key()
+        step, count = self.steps[-1], self.band_count(level - 1)
+        found = {b: self.cache.get(('band', key, b)) for b in dict.fromkeys(indices)}
+        missing = [b for b, band in found.items() if band is None]
+        inputs = self.inputs([j for b in missing for j in step.inputs(b, count)], level - 1)
+        for b in missing:
+            found[b] = self.band(b, level, inputs)
+        return [found[b] for b in indices]
+
+    def region(self, rows: slice, cols: slice) -> np.ndarray:
+        # Область куба (rows, cols, bands) после всех шагов
+        key = ('region', self.key(), rows.start, rows.stop, cols.start, cols.stop) # срезы с явными границами
+        data = self.cache.get(key)
+        if data is None:
+            data = np.asarray(self.source_region(rows, cols))
+            if self.steps:
+                data = data.astype(np.float32)
+                for step in self.steps:
+                    with profiler.timer(f'pipeline.{step.name}'):
+                        data = step.region(data, rows, cols)
+                self.cache[key] = data
+        return data
+
+    def __repr__(self):
+        return f'Pipeline({self.steps})'
+
+class LazyCube:
+    # Представление куба после конвейера в отображаемой ориентации, похожее на np.ndarray:
+    # при индексации вычисляется только запрошенная область (напр. спектр пикселя cube[y, x, :])
+
+    def __init__(self, region: Callable[[slice, slice], np.ndarray], shape: tuple[int, int, int], orientation):
+        self._region = region
+        self._shape = shape # Исходная раскладка (lines, samples, bands)
+        self.orientation = orientation
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.orientation.shape(self._shape)
+
+    @property
+    def ndim(self) -> int:
+        return 3
+
+    def __getitem__(self, key) -> np.ndarray:
+        key = key if isinstance(key, tuple) else (key,)
+        rows, cols, bands = (key + (slice(None),) * 3)[:3]
+
+        def bounds(index: int | slice, size: int) -> tuple[int, int]:
+            if isinstance(index, slice):
+                start, stop, step = index.indices(size)
+                if step != 1: raise IndexError('Поддерживаются только срезы с шагом 1')
+                return start, max(start, stop)
+            index = int(index) + size if int(index) < 0 else int(index)
+            if not 0 <= index < size: raise IndexError('Индекс вне изображения')
+            return index, index + 1
+
+        (y0, y1), (x0, x1) = bounds(rows, self.shape[0]), bounds(cols, self.shape[1])
+        nx0, ny0, nx1, ny1 = self.orientation.box_to_native(x0, y0, x1, y1, self._shape)
+        data = self.orientation.apply(self._region(slice(ny0, ny1), slice(nx0, nx1)))
+        squeeze = tuple(slice(None) if isinstance(index, slice) else 0 for index in (rows, cols))
+        return data[squeeze][..., bands]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        data = self[:, :, :]
+        return data if dtype is None else data.astype(dtype)
@@ -0,0 +1,67 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from scipy.signal import savgol_filter
+
+from .tiles import row_tiles, tile_rows
+from ..progress import Progress, Cancelled
+
+class SavGol:
+    # Фильтр Савицкого-Голея вдоль спектров (ось каналов): полосами строк в пуле потоков,
+    # вычисления и результат во float32, запись на место или в заранее выделенный буфер
+    TILE_BYTES = 64 * 2**20 # Объем полосы строк, обрабатываемой одним потоком
+
+    def __init__(self, window_length: int = 5, polyorder: int = 2, deriv: int = 0,
+                 workers: int | None = None, tile_bytes: int | None = None):
+        if window_length % 2 == 0 or window_length <= polyorder:
+            raise ValueError('Окно должно быть нечетным и больше порядка полинома')
+        if deriv > polyorder:
+            raise ValueError('Порядок производной не может превышать порядок полинома')
+        self.window_length = window_length
+        self.polyorder = polyorder
+        self.deriv = deriv
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_bytes = tile_bytes or self.TILE_BYTES
+
+    @property
+    def params(self) -> tuple[int, int, int]:
+        return self.window_length, self.polyorder, self.deriv
+
+    def filter(self, spectra: np.ndarray[float]) -> np.ndarray[np.float32]:
+        # Фильтрация массива спектров (..., bands)
+        spectra = np.asarray(spectra, dtype=np.float32)
+        return savgol_filter(spectra, self.window_length, self.polyorder, deriv=self.deriv, axis=-1)
+
+    def matrix(self, bands: int) -> np.ndarray[float]:
+        # Фильтр линеен по спектру: out = A @ spectre; строка A[b] - веса исходных каналов для канала b
+        return savgol_filter(np.eye(bands), self.window_length, self.polyorder, deriv=self.deriv, axis=-1).T
+
+    def __call__(self, data: np.ndarray[float], out: np.ndarray[np.float32] | None = None,
+                 mask: np.ndarray[bool] | None = None) -> np.ndarray[np.float32]:
+        # data - куб (lines, samples, bands), out - буфер результата (можно out=data для float32 куба),
+        # mask - сглаживаются только пиксели маски, остальные копируются без изменений
+        if out is None:
+            out = np.empty(data.shape, dtype=np.float32)
+
+        def work(rows: slice):
+            if mask is None:
+                out[rows] = self.filter(data[rows])
+                return
+            tile_mask = mask[rows]
+            if out is not data: out[rows] = data[rows]
+            if tile_mask.any():
+                tile = out[rows] # Представление, запись идет сразу в out
+                tile[tile_mask] = self.filter(data[rows][tile_mask])
+
+        rows = tile_rows(2 * data.shape[1] * data.shape[2] * 4, self.tile_bytes)
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='savgol') as pool:
+            futures = [pool.submit(work, tile) for tile in row_tiles(data.shape[0], rows)]
+            try:
+                for done, future in enumerate(futures, 1):
+                    future.result()
+                    Progress.report(done, len(futures))
+            except Cancelled:
+                for future in futures: future.cancel()
+                raise
+        return out
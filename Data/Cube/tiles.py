@@ -0,0 +1,46 @@
+import os
+import tempfile
+
+import numpy as np
+
+def row_tiles(height: int, rows: int) -> list[slice]:
+    # Разбиение изображения на полосы по rows строк
+    return [slice(r0, min(r0 + rows, height)) for r0 in range(0, height, rows)]
+
+def tile_rows(row_bytes: int, budget: int) -> int:
+    # Число строк в полосе, при котором полоса укладывается в бюджет памяти
+    return max(1, budget // max(1, row_bytes))
+
+class Scratch:
+    # Папка для результатов, отображаемых в память (создается при первом обращении,
+    # удаляется вместе с объектом)
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self._tmp: tempfile.TemporaryDirectory | None = None
+        self._count = 0
+
+    @property
+    def path(self) -> str:
+        if self._tmp is None:
+            if self.directory: os.makedirs(self.directory, exist_ok=True)
+            self._tmp = tempfile.TemporaryDirectory(prefix='hsi_', dir=self.directory,
+                                                    ignore_cleanup_errors=True)
+        return self._tmp.name
+
+    def name(self, prefix: str) -> str:
+        self._count += 1
+        return os.path.join(self.path, f'{prefix}_{self._count}')
+
+    def array(self, prefix: str, shape: tuple[int, ...], dtype: np.dtype) -> np.memmap:
+        # 2D-результат (канал, маска) в файле .npy - его можно открыть и вне приложения
+        return np.lib.format.open_memmap(self.name(prefix) + '.npy', mode='w+', dtype=dtype, shape=shape)
+
+    def release(self, path: str | None):
+        # Удалить файл результата, который больше не нужен (на Windows файл, еще отображенный в память,
+        # остается до удаления папки)
+        if path is None: return
+        try:
+            os.remove(path)
+        except OSError:
+            pass
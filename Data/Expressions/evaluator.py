@@ -0,0 +1,92 @@
+import os
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ..profiler import profiler
+from ..progress import Progress, Cancelled
+
+class Evaluator:
+    # Вычисление функции Parser по полосам строк (тайлам) в пуле потоков
+    # Каналы тайла копируются в заранее выделенные буферы потока, временные массивы
+    # выражения имеют размер тайла (остаются в кэше процессора), результат пишется сразу в выходной массив
+    TILE_ROWS = 64
+
+    def __init__(self, workers: int | None = None, tile_rows: int | None = None,
+                 dtype: np.dtype | None = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.tile_rows = tile_rows or self.TILE_ROWS
+        self.dtype = dtype # Тип вычислений (None - тип каналов)
+        self._local = threading.local()
+        self._pool: ThreadPoolExecutor | None = None
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='evaluator')
+        return self._pool
+
+    def tiles(self, height: int) -> list[slice]:
+        # Разбиение изображения на полосы строк
+        return [slice(r0, min(r0 + self.tile_rows, height)) for r0 in range(0, height, self.tile_rows)]
+
+    def buffers(self, count: int, width: int, dtype: np.dtype) -> list[np.ndarray]:
+        # Буферы каналов текущего потока (переиспользуются между тайлами и вызовами)
+        key = (count, width, np.dtype(dtype))
+        if getattr(self._local, 'key', None) != key:
+            self._local.key = key
+            self._local.buffers = [np.empty((self.tile_rows, width), dtype=dtype) for _ in range(count)]
+        return self._local.buffers
+
+    def evaluate(self, function: Callable[..., np.ndarray], bands: list[np.ndarray], rows: slice) -> np.ndarray:
+        # Вычисление функции на одном тайле
+        n = rows.stop - rows.start
+        dtype = self.dtype or np.result_type(*bands)
+        buffers = [buffer[:n] for buffer in self.buffers(len(bands), bands[0].shape[1], dtype)]
+        for buffer, band in zip(buffers, bands):
+            np.copyto(buffer, band[rows], casting='unsafe')
+        return function(*buffers)
+
+    @profiler.timed('evaluate')
+    def __call__(self, function: Callable[..., np.ndarray], bands: list[np.ndarray],
+                 out: np.ndarray | None = None) -> np.ndarray:
+        # Вычислить одноканальное изображение function(*bands) по тайлам
+        if not bands: return np.asarray(function())
+        height, width = bands[0].shape
+        tiles = self.tiles(height)
+
+        # Тип результата (число, bool для условий) определяется по первому тайлу,
+        # функция нескольких выражений (Parser.batch) возвращает список -> результат (n, height, width)
+        first = self.evaluate(function, bands, tiles[0])
+        stacked = isinstance(first, (list, tuple))
+        results = [np.asarray(result) for result in (first if stacked else [first])]
+        if out is None:
+            boolean = all(result.dtype == bool for result in results)
+            dtype = np.result_type(*results) if boolean or self.dtype is None else self.dtype
+            out = np.empty((len(results), height, width) if stacked else (height, width), dtype=dtype)
+        layers = out if stacked else out[None]
+
+        def store(result: np.ndarray | list[np.ndarray], rows: slice):
+            for layer, value in zip(layers, result if stacked else [result]):
+                layer[rows] = value
+
+        def work(rows: slice):
+            store(self.evaluate(function, bands, rows), rows)
+
+        store(first, tiles[0])
+        futures = [self.pool.submit(work, rows) for rows in tiles[1:]]
+        try:
+            for done, future in enumerate(futures, 2):
+                future.result()
+                Progress.report(done, len(tiles))
+        except Cancelled:
+            for future in futures: future.cancel() # Еще не начатые тайлы не считаются
+            raise
+        return out
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
@@ -1,19 +1,66 @@
+import os
 import re
+from collections.abc import Callable
+from typing import NamedTuple
 
 import numpy as np
 from sympy import lambdify, symbols
 from sympy.parsing.sympy_parser import parse_expr
 from sympy.printing.latex import LatexPrinter
 
+from ..cache import LRUCache
+from ..profiler import profiler
+
+# Канал: 'СловоЧисло' (напр. 'b70' или 'канал70'), но не имя функции перед скобкой (напр. 'atan2(')
+BAND = re.compile(r'(?<!\w)([a-zA-Zа-яА-Я]+)(\d+)(?![\w(])')
+
+class Compiled(NamedTuple):
+    # Результат парсинга выражения (хранится в кэше)
+    function: Callable[..., np.ndarray]
+    bands: list[int]
+    latex: str
+
 class Parser:
     # Парсинг математических выражений из строки
+    CACHE_SIZE = 128 # Число скомпилированных выражений в кэше
     
     def __init__(self):
         self.latex_printer = LatexPrinter()
+        self.cache = LRUCache(max_items=self.CACHE_SIZE)
 
+    @profiler.timed('parse')
     def __call__(self, string):
-        self.str2expr(string)
-        self.str2nm(string)
+        # Повторный парсинг того же (с точностью до пробелов и имен каналов) выражения берется из кэша;
+        # подпись строится по именам каналов пользователя (кэшируется отдельно)
+        key = Parser.normalize(string)
+        compiled: Compiled | None = self.cache.get(key)
+        if compiled is None:
+            self.str2expr(key)
+            self.str2nm(key)
+            compiled = Compiled(self._function, self._bands, self._latex_nm)
+            self.cache[key] = compiled
+        self._function, self._bands, self._latex_nm = compiled
+
+        label = Parser.compact(string)
+        if label != key:
+            latex: str | None = self.cache.get(('latex', label))
+            if latex is None:
+                self.str2nm(label)
+                self.cache[('latex', label)] = self._latex_nm
+            else:
+                self._latex_nm = latex
+        self._key = key
+
+    @staticmethod
+    def compact(string: str) -> str:
+        # Убираются лишние пробелы
+        string = re.sub(r'\s+', ' ', string.strip())
+        return re.sub(r'\s(?=\W)|(?<=\W)\s', '', string)
+
+    @staticmethod
+    def normalize(string: str) -> str:
+        # Нормализация строки: убираются лишние пробелы, каналы приводятся к виду 'b70' ('канал070' -> 'b70')
+        return BAND.sub(lambda band: f'b{int(band[2])}', Parser.compact(string))
 
     def str2expr(self, string: str) -> None:
         # Получение функции из строки
@@ -22,7 +69,7 @@ class Parser:
         expr = parse_expr(string)
 
         # Поиск переменных (роль которых выполняют номера каналов, заданные в виде 'СловоЧисло', напр. 'b70' или 'канал70')
-        lets = symbols(list(set(re.findall(r'[a-zA-Zа-яА-Я]+\d+', string))), integer=True, positive=True) # переменные
+        lets = symbols(list(set(band[0] for band in BAND.finditer(string))), integer=True, positive=True) # переменные
 
         # sympy-expression -> функция python
         self._function = lambdify(lets, expr)
@@ -30,15 +77,28 @@ class Parser:
         # переменные -> номера каналов
         self._bands: list[int] = [int(re.search(r'\d+', str(let))[0]) for let in lets]
         
+    def batch(self, strings: list[str]) -> Compiled:
+        # Совместная компиляция нескольких выражений: одна функция по объединению каналов,
+        # общие подвыражения (cse) вычисляются один раз, результат - список каналов
+        keys = tuple(Parser.normalize(string) for string in strings)
+        compiled: Compiled | None = self.cache.get(keys)
+        if compiled is None:
+            exprs = [parse_expr(key) for key in keys]
+            names = sorted(set(band[0] for key in keys for band in BAND.finditer(key)), key=lambda name: int(name[1:]))
+            lets = symbols(names, integer=True, positive=True)
+            function = lambdify(lets, exprs, cse=True)
+            compiled = Compiled(function, [int(name[1:]) for name in names], '')
+            self.cache[keys] = compiled
+        return compiled
+
     def str2nm(self, string: str) -> None:
         # Трансформация строки: номера каналов заменяются на нанометры (таблица соответствий хранится в wave)
 
-        def transform_string(string: str) -> str:
-            el = string.group(0)
-            return f"{re.search(r'[a-zA-Zа-яА-Я]+', el)[0]}{self.wave[int(re.search(r'[0-9]+', el)[0])]}"
+        def transform_string(band: re.Match) -> str:
+            return f'{band[1]}{self.wave[int(band[2])]}'
         
         # str_band -> str_nm
-        string_nm = re.sub(r'[a-zA-Zа-яА-Я]+\d+', transform_string, string)
+        string_nm = BAND.sub(transform_string, string)
 
         # str_nm -> sympy-expression
         expr_nm = parse_expr(string_nm)
@@ -50,6 +110,16 @@ class Parser:
         # Вычислить одноканальное изображение в соответствии с полученной функцией
         return self._function(*[hsi[:, :, b] for b in self.bands])
 
+    @property
+    def key(self) -> str:
+        # Нормализованная строка последнего выражения
+        return self._key
+
+    @property
+    def stats(self) -> dict[str, int]:
+        # Попадания и промахи кэша выражений
+        return self.cache.stats
+
     @property
     def latex(self):
         return self._latex_nm
@@ -65,7 +135,7 @@ class Parser:
     @property
     def wave(self) -> np.ndarray[int]:
         if not hasattr(self, '_wave'):
-            self._wave = np.load('Data/Expressions/nm.npy')
+            self._wave = np.load(os.path.join(os.path.dirname(__file__), 'nm.npy'))
         return self._wave
     
     @property
@@ -1,23 +1,45 @@
 from abc import ABC, abstractmethod
 from collections.abc import Callable
+from time import perf_counter
 from typing import Iterator
 
 import numpy as np
 import matplotlib.pyplot as plt
-from matplotlib.backend_bases import MouseEvent
+from matplotlib.backend_bases import DrawEvent, MouseEvent, TimerBase
 from matplotlib.image import AxesImage
 from matplotlib.lines import Line2D
 from matplotlib.figure import Figure
+from matplotlib.artist import Artist
 from matplotlib.transforms import Bbox
 from matplotlib.patches import Rectangle
 
+from ....profiler import profiler
+
 class Creator(ABC):
+    FPS = 30 # Целевая частота обновления при движении мыши
+    ADAPTIVE = True # Снижать частоту, если кадр не укладывается в бюджет 1 / FPS
+    ADAPTIVE_SLACK = 1.5 # Запас на обработку событий Qt между кадрами (доля времени кадра)
 
     @abstractmethod
     def __init__(self, ax_in: plt.Axes):
         self.ax_in = ax_in # Ось привязки событий
         self.connects = 'on' # Подключение событий мыши
 
+        # Движения мыши объединяются: хранится только последнее событие,
+        # обработка запускается таймером не чаще interval мс
+        self._pending: MouseEvent | None = None
+        self._timer: TimerBase | None = None
+        self._last_frame = 0.
+        self.frame_time = 0. # Сглаженное время обработки одного движения, мс
+
+        # Фоны для blit хранятся между взаимодействиями: figure -> (ключ состояния, фон).
+        # Любая полная перерисовка фигуры (смена канала, зум, размер окна) заново снимает фон,
+        # а клик/отпускание перерисовывают фигуру целиком, только если ключ изменился
+        self.figures: dict[Figure, object] = {}
+        self._backgrounds: dict[Figure, tuple[tuple, object]] = {}
+        self._watched: dict[Figure, int] = {} # figure -> cid обработчика draw_event
+        self._sticky: list[Artist] = [] # Элементы, оставшиеся анимированными после отпускания
+
     def connect(self, event: str, function: Callable[[MouseEvent], None]):
         # Привязать вызов функции к событию мыши
         return self.ax_in.figure.canvas.mpl_connect(event, function)     
@@ -69,8 +91,8 @@ class Creator(ABC):
     def after_move(self, event: MouseEvent):
         pass
 
-    def move(self, event: MouseEvent):
-        if event.inaxes != self.ax_in: return
+    def apply_move(self, event: MouseEvent):
+        # Обработка одного (последнего) движения мыши
         match event.button:
             case 1:
                 self.left_move(event)
@@ -83,6 +105,46 @@ class Creator(ABC):
         self.after_move(event)
         self.animated = 'step'
 
+    @property
+    def interval(self) -> float:
+        # Минимальный интервал между кадрами, мс
+        budget = 1000 / self.FPS
+        if not self.ADAPTIVE: return budget
+        return max(budget, self.frame_time * self.ADAPTIVE_SLACK)
+
+    def move(self, event: MouseEvent):
+        if event.inaxes != self.ax_in or event.button not in (1, 3): return
+        self._pending = event # Промежуточные события заменяются последним
+        if self._timer is not None: return # Кадр уже запланирован
+
+        wait = self.interval - (perf_counter() - self._last_frame) * 1000
+        if wait <= 0: # Давно не обновлялись - сразу
+            self.flush_move()
+            return
+        timer = self.ax_in.figure.canvas.new_timer(interval=max(round(wait), 1))
+        if type(timer) is TimerBase: # Нет цикла событий (Agg) - таймер не сработает
+            self.flush_move()
+            return
+        timer.single_shot = True
+        timer.add_callback(self.flush_move)
+        self._timer = timer
+        timer.start()
+
+    def flush_move(self):
+        # Обработать отложенное движение мыши (если есть)
+        if self._timer is not None:
+            self._timer.stop()
+            self._timer = None
+        event, self._pending = self._pending, None
+        if event is None: return
+
+        start = perf_counter()
+        self.apply_move(event)
+        self._last_frame = perf_counter()
+        elapsed = (self._last_frame - start) * 1000
+        if profiler.enabled: profiler.record('move', elapsed)
+        self.frame_time = elapsed if not self.frame_time else .7 * self.frame_time + .3 * elapsed
+
     def body_release(self, event: MouseEvent):
         pass
 
@@ -90,6 +152,7 @@ class Creator(ABC):
         pass
 
     def release(self, event: MouseEvent):
+        self.flush_move() # Последнее положение до отпускания кнопки
         if event.inaxes != self.ax_in \
             or event.button not in (1, 3) \
                 or self.exit_condition(): return
@@ -188,37 +251,102 @@ class Creator(ABC):
 
     @animated.setter
     def animated(self, mode: str):
-        match mode:
-            case 'start':
-                self.figures: dict[Figure, Bbox] = {}
-                
-                for actor in self.actors:
-                    actor.set_animated(True)
-                    fig = actor.axes.figure
-                    self.figures[fig] = None
-
-                for fig in self.figures:
-                    fig.canvas.draw()
-                    self.figures[fig] = fig.canvas.copy_from_bbox(fig.bbox)
-
-            case 'step':
-                for fig, bg in self.figures.items():
-                    fig.canvas.restore_region(bg)
-
-                for actor in self.actors:
-                    actor.axes.draw_artist(actor)
-
-                for fig in self.figures:
-                    fig.canvas.blit(fig.bbox)
-                    # fig.canvas.flush_events()
-
-            case 'stop':
-                for actor in self.actors:
-                    actor.set_animated(False)
-
-                for fig in self.figures:
-                    fig.canvas.draw()
-                
-                self.figures.clear()
-            case _:
-                return
+        with profiler.timer(f'animated.{mode}'):
+            match mode:
+                case 'start':
+                    actors = self.live_actors
+                    self.figures = {}
+                    for actor in actors:
+                        actor.set_animated(True)
+                        self.figures[actor.figure] = None
+
+                    for actor in self._sticky: # Прошлые элементы снова рисуются в фоне
+                        if actor not in actors and actor.figure is not None:
+                            self.settle(actor)
+                    self._sticky = []
+
+                    for fig in self.figures:
+                        self.figures[fig] = self.background(fig)
+                    self.blit()
+
+                case 'step':
+                    self.blit()
+
+                case 'stop':
+                    # Элементы остаются анимированными: фон без них остается верным до следующей перерисовки
+                    self._sticky = self.live_actors
+                    for actor in self._sticky: # Элементы, созданные во время взаимодействия
+                        actor.set_animated(True)
+                        self.figures.setdefault(actor.figure, None)
+                    for fig in self.figures:
+                        self.figures[fig] = self.background(fig)
+                    self.blit()
+                    self.figures.clear()
+                case _:
+                    return
+
+    @property
+    def live_actors(self) -> list[Artist]:
+        # Анимируемые элементы, которые сейчас есть на графиках
+        return [actor for actor in self.actors if actor is not None and actor.figure is not None]
+
+    @staticmethod
+    def set_data(image: AxesImage, data: np.ndarray):
+        # Новые данные изображения с номером версии: id массива может повториться после сборки мусора
+        # (ложное попадание в кэш фона), а изменение на месте id не меняет
+        image.set_data(data)
+        image.version = getattr(image, 'version', 0) + 1
+
+    @staticmethod
+    def state_key(fig: Figure) -> tuple:
+        # Все, от чего зависит фон фигуры: статичные элементы, размер, пределы осей, изображения
+        # (данные - по версии Creator.set_data)
+        static = tuple(id(child) for ax in fig.axes for child in ax.get_children() if not child.get_animated())
+        limits = tuple((ax.get_xlim(), ax.get_ylim()) for ax in fig.axes)
+        images = tuple((getattr(image, 'version', 0), image.get_clim()) for ax in fig.axes for image in ax.images)
+        return static, tuple(fig.bbox.size), limits, images
+
+    def settle(self, actor: Artist):
+        # Вернуть элемент в фон: дорисовать его на сохраненный фон вместо полной перерисовки
+        fig = actor.figure
+        cached = self._backgrounds.pop(fig, None)
+        actor.set_animated(False)
+        if cached is None or cached[0][1:] != self.state_key(fig)[1:]: return
+        fig.canvas.restore_region(cached[1])
+        actor.axes.draw_artist(actor)
+        self._backgrounds[fig] = (self.state_key(fig), fig.canvas.copy_from_bbox(fig.bbox))
+
+    def background(self, fig: Figure):
+        # Фон фигуры без анимированных элементов (полная перерисовка - только если кэш устарел)
+        self.watch(fig)
+        cached = self._backgrounds.get(fig)
+        if cached is None or cached[0] != self.state_key(fig):
+            fig.canvas.draw() # on_draw снимет фон
+            cached = self._backgrounds.get(fig)
+        return None if cached is None else cached[1]
+
+    def watch(self, fig: Figure):
+        if fig not in self._watched:
+            self._watched[fig] = fig.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event: DrawEvent):
+        # Полная перерисовка: снимаем фон и дорисовываем анимированные элементы поверх
+        fig = event.canvas.figure
+        actors = [actor for actor in self.live_actors if actor.figure is fig and actor.get_animated()]
+        if not actors:
+            self._backgrounds.pop(fig, None)
+            return
+        self._backgrounds[fig] = (self.state_key(fig), event.canvas.copy_from_bbox(fig.bbox))
+        for actor in actors:
+            actor.axes.draw_artist(actor)
+
+    def blit(self):
+        for fig, bg in self.figures.items():
+            if bg is not None: fig.canvas.restore_region(bg)
+
+        for actor in self.live_actors:
+            actor.axes.draw_artist(actor)
+
+        for fig in self.figures:
+            fig.canvas.blit(fig.bbox)
+            # fig.canvas.flush_events()
@@ -4,6 +4,7 @@ from matplotlib.patches import Rectangle
 from matplotlib.backend_bases import MouseEvent
 from matplotlib.image import AxesImage
 
+from .Elementary.creator import Creator
 from .Elementary.window import RunningWindow
 from .Elementary.style import CMAP
 
@@ -39,7 +40,7 @@ class ROI(RunningWindow):
     
     @image_roi.setter
     def image_roi(self, data: np.ndarray[float]):
-        self.image_roi.set_data(data)
+        Creator.set_data(self.image_roi, data)
 
         new_extent = list(AxesImage(self.ax_out, data=data).get_extent())
         extent = self.image_roi.get_extent()
@@ -50,6 +50,17 @@ class LimSlice(ROI):
         self.draw_in()
         self.slice.draw_all()
 
+    def slices(self) -> tuple[np.ndarray[int], np.ndarray[float]]:
+        # Все срезы всех ROI -> (столбцы roi_id, x_abs, x; значения (срезы, высота изображения)),
+        # значения среза идут с верхней границы ROI, ниже ROI - NaN
+        keys, xlines = self.slice.items()
+        points = {key: self.get_points(self[key]) for key in dict.fromkeys(keys)}
+        x0, y0, x1, y1 = np.array([points[key] for key in keys], dtype=int).reshape(-1, 4).T
+
+        columns = np.where(xlines < x1 - x0, x0 + xlines, -1) # Линия вне ROI - пустой срез
+        values = StorageSlice.gather(self.data, columns, y0, y1, self.height)
+        return np.column_stack([keys, x0 + xlines, xlines]).astype(int).reshape(-1, 3), values
+
     ########################################
 
     def after_click(self, event: MouseEvent):
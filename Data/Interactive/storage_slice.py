@@ -92,6 +92,27 @@ class StorageSlice(Slice):
         if key not in self._container: return []
         return self._container[key]
 
+    def items(self) -> tuple[list[int], np.ndarray[int]]:
+        # Все пары (ключ, x) контейнера: ключи списком (по порядку пар), координаты - массивом
+        keys = [key for key, xlines in self._container.items() for _ in xlines]
+        xlines = np.fromiter((x for xlines in self._container.values() for x in xlines), dtype=int, count=len(keys))
+        return keys, xlines
+
+    @staticmethod
+    def gather(data: np.ndarray[float], columns: np.ndarray[int], y0: np.ndarray[int], y1: np.ndarray[int],
+               height: int | None = None) -> np.ndarray[float]:
+        # Вертикальные срезы data[y0:y1, column] для всех столбцов одной выборкой -> (столбцы, height),
+        # строки ниже среза и столбцы вне изображения - NaN
+        data = np.ma.getdata(data)
+        height = data.shape[0] if height is None else height
+        columns, y0, y1 = (np.asarray(a, dtype=int)[:, None] for a in (columns, y0, y1))
+        rows = y0 + np.arange(height)
+        valid = (rows < y1) & (rows < data.shape[0]) & (0 <= columns) & (columns < data.shape[1])
+
+        out = np.full((len(columns), height), np.nan, dtype=np.result_type(data.dtype, np.float32))
+        out[valid] = data[rows[valid], np.broadcast_to(columns, valid.shape)[valid]]
+        return out
+
     ########################################
 
     def clear_canvas(self):
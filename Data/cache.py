@@ -0,0 +1,98 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from threading import RLock
+from typing import Any
+
+class LRUCache:
+    # LRU-кэш с ограничением по числу элементов и/или по объему (в байтах);
+    # on_evict(value) - освобождение вытесненного значения (напр. удаление файла результата)
+
+    def __init__(self, max_items: int | None = None, max_bytes: int | None = None,
+                 on_evict: Callable[[Any], None] | None = None):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._items: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def sizeof(value: Any) -> int:
+        # Объем значения: массивы numpy (и кортежи из них) считаются по nbytes
+        if isinstance(value, (tuple, list)):
+            return sum(map(LRUCache.sizeof, value))
+        return int(getattr(value, 'nbytes', 0))
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key: Hashable, value: Any, nbytes: int | None = None):
+        nbytes = self.sizeof(value) if nbytes is None else nbytes
+        with self._lock:
+            if key in self._items:
+                previous, size = self._items.pop(key)
+                self.nbytes -= size
+                if previous is not value: self.release(previous)
+            if self.max_bytes is not None and nbytes > self.max_bytes: # Не помещается целиком
+                self.release(value)
+                return
+            self._items[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self.evict()
+
+    def evict(self):
+        # Вытеснение самых старых элементов до соблюдения ограничений
+        with self._lock:
+            while self._items and (
+                (self.max_items is not None and len(self._items) > self.max_items) or
+                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+                value, nbytes = self._items.popitem(last=False)[1]
+                self.nbytes -= nbytes
+                self.evictions += 1
+                self.release(value)
+
+    def release(self, value: Any):
+        if self.on_evict is not None: self.on_evict(value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._items: return default
+            value, nbytes = self._items.pop(key)
+            self.nbytes -= nbytes
+            return value
+
+    def clear(self):
+        with self._lock:
+            values = [value for value, _ in self._items.values()]
+            self._items.clear()
+            self.nbytes = 0
+            for value in values:
+                self.release(value)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {'items': len(self), 'bytes': self.nbytes, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._items
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, self)
+        if value is self: raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.put(key, value)
+
+    def __len__(self) -> int:
+        return len(self._items)
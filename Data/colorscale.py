@@ -0,0 +1,84 @@
+from collections.abc import Hashable
+
+import numpy as np
+
+from .cache import LRUCache
+
+class ColorScale:
+    # Границы цветовой шкалы по перцентилям изображения с кэшем по ключу (версии) канала.
+    # Режимы:
+    #   exact     - np.percentile по всем пикселям (сортировка, медленно на больших каналах),
+    #   histogram - по накопленной гистограмме из BINS корзин (два линейных прохода, ошибка <= ширины корзины),
+    #   sampled   - np.percentile по регулярной подвыборке не больше SAMPLES пикселей
+    # mask - учитываются только пиксели маски (зануленный фон не сдвигает шкалу),
+    # NaN и бесконечности не учитываются
+    MODES = ('exact', 'histogram', 'sampled')
+    BINS = 4096
+    SAMPLES = 2**18
+
+    def __init__(self, mode: str = 'histogram', percentiles: tuple[float, float] = (1, 99), max_items: int = 64):
+        self.mode = mode
+        self.percentiles = percentiles
+        self.cache = LRUCache(max_items=max_items) # (ключ канала, режим, перцентили) -> границы
+
+    @property
+    def mode(self) -> str:
+        return self._mode
+
+    @mode.setter
+    def mode(self, mode: str):
+        if mode not in self.MODES: raise ValueError(f'Неизвестный режим шкалы: {mode}')
+        self._mode = mode
+
+    def __call__(self, img: np.ndarray[float], key: Hashable = None, mask: np.ndarray[bool] | None = None) -> tuple[float, float]:
+        # key=None - изображение без версии (не кэшируется)
+        cache_key = None if key is None else (key, self.mode, tuple(self.percentiles), mask is not None)
+        limits = None if cache_key is None else self.cache.get(cache_key)
+        if limits is None:
+            limits = self.compute(img, mask)
+            if cache_key is not None: self.cache[cache_key] = limits
+        return limits
+
+    def compute(self, img: np.ndarray[float], mask: np.ndarray[bool] | None = None) -> tuple[float, float]:
+        if self.mode == 'sampled':
+            img, mask = self.sample(img, mask)
+        values = self.values(img, mask)
+        if not values.size: return (0., 1.)
+
+        if self.mode == 'histogram':
+            return self.histogram(values)
+        low, high = np.percentile(values, self.percentiles)
+        return float(low), float(high)
+
+    def sample(self, img: np.ndarray[float], mask: np.ndarray[bool] | None) -> tuple[np.ndarray, np.ndarray | None]:
+        # Регулярная подвыборка с одинаковым шагом по строкам и столбцам (детерминированная)
+        step = int(np.ceil(np.sqrt(img.size / self.SAMPLES)))
+        if step <= 1: return img, mask
+        return img[::step, ::step], None if mask is None else mask[::step, ::step]
+
+    @staticmethod
+    def values(img: np.ndarray[float], mask: np.ndarray[bool] | None) -> np.ndarray[float]:
+        # Конечные значения (под маской) одним массивом
+        img = np.asarray(img)
+        finite = np.isfinite(img)
+        if mask is not None: finite &= mask
+        return img.ravel() if finite.all() else img[finite]
+
+    def histogram(self, values: np.ndarray[float]) -> tuple[float, float]:
+        low, high = float(values.min()), float(values.max())
+        if low == high: return low, high
+
+        scale = self.BINS / (high - low)
+        bins = ((values - low) * scale).astype(np.int32) # В типе значений (float32 - без копии в float64)
+        np.clip(bins, 0, self.BINS - 1, out=bins)
+        cdf = np.cumsum(np.bincount(bins, minlength=self.BINS))
+
+        # Линейная интерполяция внутри корзины, в которую попадает перцентиль
+        limits = []
+        for q in self.percentiles:
+            rank = q / 100 * (cdf[-1] - 1)
+            b = int(np.searchsorted(cdf, rank, side='right'))
+            before = cdf[b - 1] if b else 0
+            inside = (rank - before + .5) / max(cdf[b] - before, 1)
+            limits.append(float(low + (b + min(inside, 1)) / scale))
+        return limits[0], limits[1]
@@ -0,0 +1,145 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+def band_pairs(bands: int) -> tuple[np.ndarray[int], np.ndarray[int]]:
+    # Все пары каналов i < j (для 204 каналов - 20 706 пар)
+    return np.triu_indices(bands, k=1)
+
+def normalized_difference(spectra: np.ndarray[float], i: np.ndarray[int], j: np.ndarray[int]) -> np.ndarray[np.float32]:
+    # ND(i, j) = (bi - bj) / (bi + bj) для спектров в раскладке (bands, n) -> (len(i), n)
+    x, y = spectra[i].astype(np.float32, copy=False), spectra[j].astype(np.float32, copy=False)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nd = x - y
+        y += x
+        nd /= y
+    return np.nan_to_num(nd, copy=False, nan=0, posinf=1, neginf=-1)
+
+def mean_nd_matrix(spectra: np.ndarray[float], workers: int | None = None, block: int = 256) -> np.ndarray[float]:
+    # Среднее по пикселям матриц ND: M[i, j] = mean((bj - bi) / (bj + bi)) (ориентация как в HSI.mean_matrix)
+    # Пиксели (n, bands) обрабатываются блоками по block штук в пуле потоков, считается только
+    # верхний треугольник - матрица антисимметрична
+    spectra = np.asarray(spectra, dtype=np.float32)
+    n, bands = spectra.shape
+    if not n: return np.zeros((bands, bands))
+
+    def accumulate(start: int) -> np.ndarray[float]:
+        x = np.ascontiguousarray(spectra[start:start+block].T) # (bands, block)
+        upper = np.zeros((bands, bands))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(bands - 1):
+                y = x[i+1:]
+                nd = y - x[i]
+                nd /= y + x[i]
+                upper[i, i+1:] = np.nan_to_num(nd, copy=False).sum(axis=1)
+        return upper
+
+    with ThreadPoolExecutor(workers or os.cpu_count() or 1, thread_name_prefix='ndmatrix') as pool:
+        upper = sum(pool.map(accumulate, range(0, n, block)))
+    upper /= n
+    return upper - upper.T
+
+class BandPairSearch:
+    # Поиск пары каналов, индекс ND(i, j) которой лучше всего разделяет группы ROI
+    # (напр. 'здоровые' и 'зараженные'). Для каждой пары считаются:
+    #   fisher - отношение межгрупповой дисперсии к внутригрупповой (по всем группам),
+    #   effect - размер эффекта Коэна d между первыми двумя группами,
+    #   auc    - площадь под ROC-кривой для первых двух групп (по гистограммам ND из BINS корзин)
+    # Пары обрабатываются векторизованными блоками в пуле потоков
+    METRICS = ('fisher', 'effect', 'auc')
+    BINS = 1024
+    BLOCK_BYTES = 2**19 # Объем ND одного блока пар для одной группы (помещается в кэш процессора)
+
+    def __init__(self, groups: list[np.ndarray[float]], workers: int | None = None):
+        if len(groups) < 2: raise ValueError('Нужно не меньше двух групп')
+        # Группы хранятся в раскладке (bands, n): выборка каналов пары - непрерывные строки
+        self.groups = [np.ascontiguousarray(np.asarray(group, dtype=np.float32).T) for group in groups]
+        if any(group.shape[1] < 2 for group in self.groups): raise ValueError('В каждой группе нужно не меньше двух пикселей')
+        self.bands = self.groups[0].shape[0]
+        self.pairs = band_pairs(self.bands)
+        self.workers = workers or os.cpu_count() or 1
+        self._scores: dict[str, np.ndarray] | None = None
+
+    @classmethod
+    def from_rois(cls, hsi, groups: list[list[tuple[int, int, int, int]]], **kwargs) -> 'BandPairSearch':
+        # groups - списки прямоугольников (x0, y0, x1, y1) в экранных координатах HSI
+        return cls([np.concatenate([hsi.roi_pixels(*roi) for roi in rois]) for rois in groups], **kwargs)
+
+    ########################################
+
+    def block(self, pairs: slice) -> dict[str, np.ndarray]:
+        # Метрики для блока пар
+        i, j = self.pairs[0][pairs], self.pairs[1][pairs]
+        k = len(i)
+        counts, means, variances, hists = [], [], [], []
+        offsets = (np.arange(k, dtype=np.int32) * self.BINS)[:, None]
+        for g, group in enumerate(self.groups):
+            nd = normalized_difference(group, i, j)
+            if g < 2:
+                bins = ((nd + 1) * (self.BINS / 2)).astype(np.int32)
+                np.clip(bins, 0, self.BINS - 1, out=bins)
+                bins += offsets
+                hists.append(np.bincount(bins.ravel(), minlength=k * self.BINS).reshape(k, self.BINS))
+            mean = nd.sum(axis=1, dtype=np.float64) / nd.shape[1]
+            nd -= mean[:, None].astype(np.float32)
+            counts.append(nd.shape[1])
+            means.append(mean)
+            variances.append(np.einsum('ij,ij->i', nd, nd) / (nd.shape[1] - 1))
+
+        n, mu, var = np.array(counts)[:, None], np.array(means), np.array(variances)
+        total = (n * mu).sum(axis=0) / n.sum()
+        between = (n * (mu - total) ** 2).sum(axis=0)
+        within = ((n - 1) * var).sum(axis=0)
+
+        pooled = np.sqrt(((n[0] - 1) * var[0] + (n[1] - 1) * var[1]) / (n[0] + n[1] - 2))
+        below = np.cumsum(hists[1], axis=1) - hists[1] # Число значений второй группы в корзинах ниже
+        auc = ((hists[0] * below).sum(axis=1) + 0.5 * (hists[0] * hists[1]).sum(axis=1)) / (n[0] * n[1])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return {'fisher': np.nan_to_num(between / within),
+                    'effect': np.nan_to_num((mu[0] - mu[1]) / pooled),
+                    'auc': auc}
+
+    def run(self) -> dict[str, np.ndarray[float]]:
+        # Метрики для всех пар (в порядке band_pairs)
+        if self._scores is not None: return self._scores
+        size = max(1, self.BLOCK_BYTES // (4 * max(group.shape[1] for group in self.groups)))
+        blocks = [slice(start, start + size) for start in range(0, len(self.pairs[0]), size)]
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='bandpair') as pool:
+            results = list(pool.map(self.block, blocks))
+        self._scores = {metric: np.concatenate([result[metric] for result in results]) for metric in self.METRICS}
+        return self._scores
+
+    @staticmethod
+    def rank_value(metric: str, scores: np.ndarray[float]) -> np.ndarray[float]:
+        # Чем больше, тем лучше разделение (знак d и сторона AUC не важны)
+        match metric:
+            case 'effect': return np.abs(scores)
+            case 'auc': return np.abs(scores - .5)
+            case _: return scores
+
+    def table(self, metric: str = 'fisher', wavelengths: np.ndarray | None = None, top: int | None = None) -> np.ndarray:
+        # Таблица пар, отсортированная по метрике: band_i, band_j, (nm_i, nm_j), fisher, effect, auc
+        scores = self.run()
+        order = np.argsort(-self.rank_value(metric, scores[metric]), kind='stable')[:top]
+        i, j = self.pairs[0][order], self.pairs[1][order]
+        fields = [('band_i', int), ('band_j', int)]
+        if wavelengths is not None: fields += [('nm_i', float), ('nm_j', float)]
+        fields += [(name, float) for name in self.METRICS]
+
+        table = np.empty(len(order), dtype=fields)
+        table['band_i'], table['band_j'] = i, j
+        if wavelengths is not None:
+            table['nm_i'], table['nm_j'] = np.asarray(wavelengths)[i], np.asarray(wavelengths)[j]
+        for name in self.METRICS:
+            table[name] = scores[name][order]
+        return table
+
+    def heatmap(self, metric: str = 'fisher') -> np.ndarray[float]:
+        # Матрица (bands, bands) значений метрики для ранжирования, симметричная, диагональ - NaN
+        heatmap = np.full((self.bands, self.bands), np.nan)
+        values = self.rank_value(metric, self.run()[metric])
+        heatmap[self.pairs] = values
+        heatmap[self.pairs[::-1]] = values
+        return heatmap
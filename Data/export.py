@@ -0,0 +1,171 @@
+import os
+import csv
+from importlib.util import find_spec
+from collections.abc import Sequence
+
+import numpy as np
+
+from .Cube.envi import EnviCube, ENVI_DTYPES
+from .Cube.tiles import row_tiles, tile_rows
+from .progress import Progress
+from .profiler import profiler
+
+# Сохранение результатов без построения списков Python и DataFrame: массивы (в памяти или отображенные
+# в память) пишутся полосами строк по CHUNK_BYTES. Форматы выбираются по расширению файла:
+#   .npy     - один массив (формат NumPy, открывается np.load(..., mmap_mode='r')),
+#   .npz     - несколько массивов в одном архиве,
+#   .hdr     - ENVI (.hdr + .raw, BIL) - открывается этим приложением и ENVI-совместимыми программами,
+#   .parquet - колоночный формат группами строк (нужен пакет pyarrow),
+#   .csv     - текст полосами строк,
+#   .xlsx    - Excel, только для небольших таблиц (ROI, средние спектры)
+# Форматы с одним массивом на файл при нескольких массивах пишут файлы <имя>_<массив>.<расширение>
+FORMATS = {
+    '.npy': 'NumPy (*.npy)',
+    '.npz': 'NumPy архив (*.npz)',
+    '.hdr': 'ENVI (*.hdr)',
+    '.parquet': 'Parquet (*.parquet)',
+    '.csv': 'CSV (*.csv)',
+    '.xlsx': 'Excel (*.xlsx)',
+}
+REQUIRES = {'.parquet': 'pyarrow'} # Необязательные пакеты: без них формат не предлагается в диалоге
+CHUNK_BYTES = 64 * 2**20
+EXCEL_MAX_CELLS = 500_000 # openpyxl пишет ячейки по одной: ~10^5 ячеек/с
+
+def available(ext: str) -> bool:
+    return ext not in REQUIRES or find_spec(REQUIRES[ext]) is not None
+
+def file_filter(extensions: Sequence[str]) -> str:
+    # Фильтр диалога сохранения Qt: 'NumPy (*.npy);;Excel (*.xlsx)' (только форматы с установленными пакетами)
+    return ';;'.join(FORMATS[ext] for ext in extensions if available(ext))
+
+def extension(path: str, selected_filter: str = '') -> str:
+    # Расширение из имени файла или из выбранного в диалоге фильтра
+    ext = os.path.splitext(path)[1].lower()
+    if ext in FORMATS: return ext
+    for ext, name in FORMATS.items():
+        if name == selected_filter: return ext
+    raise ValueError(f'Неизвестный формат файла: {path}')
+
+def table(columns: dict[str, Sequence]) -> np.ndarray:
+    # Таблица {столбец: значения} -> структурированный массив (поля - столбцы)
+    return np.rec.fromarrays([np.asarray(values) for values in columns.values()], names=list(columns)).view(np.ndarray)
+
+def chunks(array: np.ndarray) -> list[slice]:
+    # Полосы строк (первая ось), укладывающиеся в CHUNK_BYTES
+    row_bytes = array.itemsize * int(np.prod(array.shape[1:], dtype=np.int64))
+    return row_tiles(array.shape[0], tile_rows(row_bytes, CHUNK_BYTES))
+
+########################################
+
+def save(path: str, arrays: dict[str, np.ndarray], wavelengths: Sequence[float] | None = None,
+         columns: dict[str, Sequence] | None = None, selected_filter: str = ''):
+    # Сохранить массивы {имя: массив} в формате по расширению path (или фильтру диалога).
+    # wavelengths - для ENVI (поле wavelength трехмерных массивов), columns - подписи столбцов таблиц
+    ext = extension(path, selected_filter)
+    base = path if os.path.splitext(path)[1].lower() == ext else path + ext
+    base = os.path.splitext(base)[0]
+    columns = columns or {}
+
+    with profiler.timer(f'export{ext}'):
+        if ext == '.npz': return save_npz(base + ext, arrays)
+        if ext == '.xlsx': return save_excel(base + ext, arrays, columns)
+
+        for name, array in arrays.items():
+            target = base + ext if len(arrays) == 1 else f'{base}_{name}{ext}'
+            match ext:
+                case '.npy': save_npy(target, array)
+                case '.hdr': save_envi(target, array, wavelengths)
+                case '.parquet': save_parquet(target, array, columns.get(name))
+                case '.csv': save_csv(target, array, columns.get(name))
+
+def save_npy(path: str, array: np.ndarray):
+    array = np.asanyarray(array)
+    if array.ndim == 0: return np.save(path, array)
+    out = np.lib.format.open_memmap(path, mode='w+', dtype=array.dtype, shape=array.shape)
+    tiles = chunks(array)
+    for done, rows in enumerate(tiles, 1):
+        out[rows] = array[rows]
+        Progress.report(done, len(tiles))
+    out.flush()
+    profiler.count_bytes('export.npy', array.nbytes)
+
+def save_npz(path: str, arrays: dict[str, np.ndarray], compress: bool = False):
+    # np.savez пишет каждый массив буферами (nditer), без копии всего массива
+    (np.savez_compressed if compress else np.savez)(path, **arrays)
+    profiler.count_bytes('export.npz', sum(np.asanyarray(array).nbytes for array in arrays.values()))
+
+def save_envi(path: str, array: np.ndarray, wavelengths: Sequence[float] | None = None):
+    # Один проход по строкам: (h, w) -> 1 канал, (h, w, bands) -> bands каналов, (n,) -> 1 строка
+    array = np.asanyarray(array)
+    if array.dtype.names is not None: raise ValueError('ENVI: сохраняются только числовые массивы')
+    shape = {1: lambda: (1, array.shape[0], 1), 2: lambda: (*array.shape, 1), 3: lambda: array.shape}
+    if array.ndim not in shape: raise ValueError(f'ENVI: неподдерживаемая размерность {array.ndim}')
+    lines, samples, bands = shape[array.ndim]()
+
+    dtype = np.dtype(np.uint8) if array.dtype == bool else array.dtype
+    if dtype.newbyteorder('=') not in map(np.dtype, ENVI_DTYPES.values()): dtype = np.dtype(np.float32)
+    band_names = wavelengths if array.ndim == 3 and wavelengths is not None and len(wavelengths) == bands else None
+    cube = EnviCube.create(path, (lines, samples, bands), dtype, interleave='bil', wavelengths=band_names, cache_bytes=0)
+
+    data = array.reshape(lines, samples, bands) if array.ndim == 1 else array
+    tiles = chunks(data)
+    for done, rows in enumerate(tiles, 1):
+        block = data[rows]
+        cube.data[rows] = block if block.ndim == 3 else block[..., None]
+        Progress.report(done, len(tiles))
+    cube.raw.flush()
+    profiler.count_bytes('export.hdr', array.nbytes)
+
+def save_parquet(path: str, array: np.ndarray, names: Sequence | None = None):
+    # Группа строк Parquet на полосу строк; столбцы - поля структурированного массива или столбцы 2D
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as error:
+        raise ImportError('Для сохранения в .parquet нужен пакет pyarrow') from error
+
+    array = np.asanyarray(array)
+    if array.dtype.names is None:
+        array = array.reshape(len(array), -1) if array.ndim != 1 else array[:, None]
+        columns = [lambda block, j=j: block[:, j] for j in range(array.shape[1])]
+        dtypes = [array.dtype] * array.shape[1]
+    else:
+        columns = [lambda block, field=field: block[field] for field in array.dtype.names]
+        dtypes = [array.dtype[field] for field in array.dtype.names]
+    names = [str(name) for name in (names if names is not None else array.dtype.names or range(len(columns)))]
+    schema = pa.schema([(name, pa.from_numpy_dtype(dtype)) for name, dtype in zip(names, dtypes)])
+
+    tiles = chunks(array)
+    with pq.ParquetWriter(path, schema) as writer:
+        for done, rows in enumerate(tiles, 1):
+            block = np.asarray(array[rows])
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(column(block)) for column in columns], schema=schema))
+            Progress.report(done, len(tiles))
+    profiler.count_bytes('export.parquet', array.nbytes)
+
+def save_csv(path: str, array: np.ndarray, names: Sequence | None = None):
+    array = np.asanyarray(array)
+    if array.dtype.names is None: array = array.reshape(len(array), -1) if array.ndim != 1 else array[:, None]
+    names = names if names is not None else array.dtype.names
+    tiles = chunks(array)
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        if names is not None: csv.writer(file, lineterminator='\n').writerow(names) # Подписи с запятыми - в кавычках
+        for done, rows in enumerate(tiles, 1):
+            np.savetxt(file, array[rows], fmt='%.7g', delimiter=',')
+            Progress.report(done, len(tiles))
+    profiler.count_bytes('export.csv', array.nbytes)
+
+def save_excel(path: str, arrays: dict[str, np.ndarray], columns: dict[str, Sequence]):
+    # Лист на массив; большие массивы (напр. канал целиком) в Excel не пишутся
+    arrays = {name: np.asanyarray(array) for name, array in arrays.items()}
+    cells = sum(array.size * len(array.dtype.names or (None,)) for array in arrays.values())
+    if cells > EXCEL_MAX_CELLS:
+        raise ValueError(f'Слишком много ячеек для Excel ({cells} > {EXCEL_MAX_CELLS}): '
+                         'сохраните в .npy, .npz, .parquet или ENVI (.hdr)')
+
+    import pandas as pd # Только для Excel
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        for name, array in arrays.items():
+            frame = pd.DataFrame(array if array.ndim != 1 or array.dtype.names else array[None])
+            if name in columns: frame.columns = list(columns[name])
+            frame.to_excel(writer, sheet_name=name)
@@ -1,96 +1,300 @@
+from collections.abc import Callable
+
 import numpy as np
-from pysptools.util import load_ENVI_file as load_hsi
-from scipy.signal import savgol_filter
 
+from .cache import LRUCache
 from .Expressions.parse import Parser
+from .Expressions.evaluator import Evaluator
+from .Cube.envi import EnviCube
+from .Cube.orientation import Orientation
+from .Cube.pipeline import Pipeline, Smooth, LazyCube
+from .Cube.integral import SummedArea
+from .Cube.tiles import Scratch, row_tiles, tile_rows
+from .difference import mean_nd_matrix
+from .profiler import profiler
+from .progress import Progress
 
 class HSI:
     # Класс для работы с HSI
     RGB_BANDS = (70, 53, 19)
+    BAND_CACHE_BYTES = 512 * 2**20 # Бюджет кэша каналов, читаемых по требованию
+    CHANNEL_DTYPE = np.float32 # Тип вычисляемых каналов
+    RESULT_CACHE_BYTES = 256 * 2**20 # Бюджет кэша вычисленных каналов и масок
+    MEMORY_LIMIT = 4 * 2**30 # Кубы больше этого объема обрабатываются полосами с диска (out-of-core)
+    TILE_BYTES = 256 * 2**20 # Потолок памяти на одну полосу в режиме out-of-core
+    SCRATCH_DIR: str | None = None # Папка для результатов out-of-core (None - временная)
+    PIPELINE_CACHE_BYTES = 512 * 2**20 # Бюджет кэша промежуточных результатов конвейера
+    INTEGRAL_BYTES = 2 * 2**30 # Интегральные изображения больше этого объема хранятся на диске
+    SCRATCH_BYTES = 16 * 2**30 # Бюджет диска для каналов out-of-core (вытесненные файлы удаляются)
 
-    def __init__(self):
+    def __init__(self, out_of_core: bool | None = None, memory: int | None = None):
+        # memory - общий бюджет памяти объекта (байты), делится между кэшами каналов, результатов и конвейера;
+        # интегральные изображения больше бюджета и кубы больше бюджета обрабатываются на диске.
+        # None - бюджеты класса
+        if memory is not None:
+            self.BAND_CACHE_BYTES = memory // 2
+            self.RESULT_CACHE_BYTES = self.PIPELINE_CACHE_BYTES = memory // 4
+            self.INTEGRAL_BYTES = self.MEMORY_LIMIT = memory
+            self.TILE_BYTES = min(self.TILE_BYTES, memory // 4)
         self._parser = Parser()
+        self.evaluator = Evaluator(dtype=self.CHANNEL_DTYPE)
+        self.results = LRUCache(max_bytes=self.RESULT_CACHE_BYTES) # (выражение, ключ данных) -> канал/маска
+        self.scratch = Scratch(self.SCRATCH_DIR)
+        self.stored = LRUCache(max_bytes=self.SCRATCH_BYTES, # То же для каналов out-of-core в файлах scratch
+                               on_evict=lambda channel: self.scratch.release(channel.filename))
+        self.version = 0 # Номер загруженного куба
+        self.mask_version = 0 # Номер маски, заданной извне (сеттером mask)
+        self.out_of_core = out_of_core # None - выбирается автоматически по MEMORY_LIMIT
+        self.schedule: Callable[[Callable[[], object]], object] | None = None # Запуск долгих построений в фоне (задается интерфейсом)
     
     def load(self, path='test_data/tobacco.hdr'):
-        self.hsi = np.rot90(load_hsi(path)[0], k = 3)
+        # Куб отображается в память и хранится в исходной раскладке файла,
+        # поворот (как раньше np.rot90(..., k=3)) задается виртуальной ориентацией
+        self.cube = EnviCube(path, cache_bytes=self.BAND_CACHE_BYTES)
+        self._data = self.cube.data
+        self.orientation = Orientation(k=3)
+        if hasattr(self, '_mask'): del self._mask # Маска предыдущего куба
+        self.results.clear()
+        self.stored.clear()
+        self.version += 1
+        self._prefetch = self.RGB_BANDS # Читаются вместе с первым выражением
+
+        # Фильтрация и другие изменения данных - ленивые шаги конвейера над исходным кубом
+        self.pipeline = Pipeline(self.source_bands, self.source_region, self._data.shape[2],
+                                 cache_bytes=self.PIPELINE_CACHE_BYTES)
+
+    def source_bands(self, indices: list[int]) -> list[np.ndarray]:
+        # Исходные каналы по требованию (с диска читаются только запрошенные)
+        prefetch, self._prefetch = self._prefetch, ()
+        return self.cube.bands(indices, prefetch)
+
+    def source_region(self, rows: slice, cols: slice) -> np.ndarray:
+        return self._data[rows, cols]
+
+    def bands(self, indices: list[int]) -> list[np.ndarray]:
+        # Каналы HSI в исходной раскладке после шагов конвейера
+        return self.pipeline.bands(indices)
+
+    def region(self, rows: slice, cols: slice | None = None) -> np.ndarray:
+        # Область куба (rows, cols, bands) в исходной раскладке после шагов конвейера
+        cols = slice(0, self._data.shape[1]) if cols is None else cols
+        return self.pipeline.region(slice(*rows.indices(self._data.shape[0])[:2]),
+                                    slice(*cols.indices(self._data.shape[1])[:2]))
+
+    @property
+    def data_key(self) -> tuple:
+        # Ключ текущих данных: номер куба и цепочка шагов конвейера
+        return (self.version, self.pipeline.key())
+
+    @property
+    def streaming(self) -> bool:
+        # Режим out-of-core: куб обрабатывается полосами строк с фиксированным потолком памяти
+        if self.out_of_core is not None: return self.out_of_core
+        return self._data.nbytes > self.MEMORY_LIMIT
+
+    def tile_rows(self, bands: int | None = None) -> int:
+        # Число строк полосы, укладывающейся в TILE_BYTES (с запасом на временные массивы)
+        bands = self.pipeline.band_count() if bands is None else bands
+        return tile_rows(2 * self._data.shape[1] * max(1, bands) * self._data.itemsize, self.TILE_BYTES)
+
+    def read_rows(self, indices: list[int], rows: slice) -> list[np.ndarray]:
+        # Каналы в полосе строк исходной раскладки (без кэша каналов)
+        if not self.pipeline.steps:
+            return list(self.cube.read_bands(indices, rows))
+        region = self.region(rows)
+        return [region[:, :, b] for b in indices]
 
+    def stream_channel(self, function, indices: list[int]) -> np.memmap:
+        # Вычисление канала полосами строк с записью в файл, отображенный в память
+        out = None
+        tiles = row_tiles(self._data.shape[0], self.tile_rows(len(indices)))
+        for done, rows in enumerate(tiles, 1):
+            with Progress(): # Прогресс считается по полосам, а не по тайлам вычислителя
+                result = self.evaluator(function, self.read_rows(indices, rows))
+            if out is None:
+                out = self.scratch.array('channel', self._data.shape[:2], result.dtype)
+            out[rows] = result
+            Progress.report(done, len(tiles))
+        out.flush()
+        return out
+
+    @profiler.timed('calculate_channel')
     def calculate_channel(self, string: str | None = None) -> np.ndarray:
         # Вычислить одноканальное изображение из строки
         if string: self.string = string
 
         self.parser(self.string) # Парсинг мат. выражения
-        function = self.parser.function # Функция (рез-т парсинга)
+        key = (self.parser.key, self.data_key)
 
-        channels = [self.hsi[:, :, b] for b in self.parser.bands] # Каналы (рез-т парсинга) 
-        channel: np.ndarray[float | bool] = function(*channels) # Применение функции к каналам HSI
+        results = self.stored if self.streaming else self.results
+        channel: np.ndarray[float | bool] | None = results.get(key) # Уже вычисленный результат
+        if channel is None:
+            function = self.parser.function # Функция (рез-т парсинга)
+            if self.streaming:
+                channel = self.stream_channel(function, self.parser.bands) # Результат на диске
+            else:
+                channels = self.bands(self.parser.bands) # Каналы (рез-т парсинга) 
+                channel = self.evaluator(function, channels) # Применение функции к каналам HSI
+            channel.flags.writeable = False # Результаты в кэше не меняются, поэтому не копируются
+            profiler.count_bytes('calculate_channel', channel.nbytes)
+            results.put(key, channel)
 
         if channel.dtype == bool: # Если мат. выражение это условие
-            self.mask = channel
+            self._mask, self._mask_key = channel, key
+        else:
+            self._channel, self._channel_key = channel, key
+
+        return self.orientation.apply(channel)
+
+    def preview(self, string: str, stride: int = 8) -> tuple[np.ndarray[float], np.ndarray[bool]]:
+        # Грубый просмотр выражения по каждому stride-му пикселю строк и столбцов -> (канал с зануленным фоном, маска)
+        # Без шагов конвейера с диска читаются только нужные строки; канал, маска и кэш результатов не меняются
+        self.parser(string)
+        indices, step = self.parser.bands, slice(None, None, stride)
+        if self.pipeline.steps or all(b in self.cube.cache for b in indices): # Каналы уже в памяти или считает конвейер
+            channels = [band[step, step] for band in self.bands(indices)]
+        else:
+            channels = [band[:, step] for band in self.cube.read_bands(indices, step)]
+        result = self.evaluator(self.parser.function, channels)
+
+        self.mask
+        mask = self._mask[step, step]
+        if result.dtype == bool: # Условие: текущий канал под новой маской
+            mask = result
+            result = self._channel[step, step] if hasattr(self, '_channel') else result.astype(np.float32)
+        return self.orientation.apply(np.where(mask, result, 0)), self.orientation.apply(mask)
+
+    def calculate_channels(self, expressions: list[str], masked: bool = False) -> np.ndarray[float]:
+        # Вычислить несколько индексов за один проход по кубу -> (len(expressions), height, width)
+        # Каждый канал читается один раз, общие подвыражения вычисляются один раз,
+        # masked=True - вычисление только по пикселям маски (фон зануляется)
+        compiled = self.parser.batch(expressions)
+        if self.streaming: return self.stream_channels(compiled, len(expressions), masked)
+        channels = self.bands(compiled.bands)
+
+        if not masked:
+            result = self.evaluator(compiled.function, channels)
         else:
-            self.channel = channel
+            self.mask
+            width = self._data.shape[1]
+            count = int(self._mask.sum())
+            rows = max(1, -(-count // width)) # Пиксели маски упаковываются в строки исходной ширины
+            packed = [np.ones((rows, width), dtype=channel.dtype) for channel in channels]
+            for pack, channel in zip(packed, channels):
+                pack.reshape(-1)[:count] = channel[self._mask]
+            values = self.evaluator(compiled.function, packed)
+            result = np.zeros((len(expressions), *self._data.shape[:2]), dtype=values.dtype)
+            result[:, self._mask] = values.reshape(len(expressions), -1)[:, :count]
+
+        return np.stack([self.orientation.apply(channel) for channel in result])
 
-        return self._channel
+    def stream_channels(self, compiled, count: int, masked: bool = False) -> np.ndarray[float]:
+        # calculate_channels полосами строк (как stream_channel): результат (высота, ширина, выражения)
+        # в файле, отображенном в память -> представление (выражения, высота, ширина) в отображаемой ориентации
+        self.mask
+        out = None
+        tiles = row_tiles(self._data.shape[0], self.tile_rows(len(compiled.bands) + count))
+        for done, rows in enumerate(tiles, 1):
+            with Progress():
+                values = self.evaluator(compiled.function, self.read_rows(compiled.bands, rows))
+            if masked: values = np.where(self._mask[rows], values, 0)
+            if out is None:
+                out = self.scratch.array('channels', (*self._data.shape[:2], count), values.dtype)
+            out[rows] = np.moveaxis(values, 0, -1)
+            Progress.report(done, len(tiles))
+        out.flush()
+        return np.moveaxis(self.orientation.apply(out), -1, 0)
 
     def rot(self):
-        # Поворот HSI
-        self.hsi = np.rot90(self.hsi)
-        self.mask_hsi
-        self._mask_hsi = np.rot90(self._mask_hsi)
+        # Поворот HSI (меняется только ориентация, данные не копируются,
+        # поэтому версия куба и кэш результатов остаются прежними)
+        self.orientation.rotate()
+
+    def flip(self):
+        # Отражение HSI по горизонтали (меняется только ориентация)
+        self.orientation.flip()
     
-    def savgol(self):
-        # Применение фильтра Савицкого-Голея для сглаживания спектров
-        self.hsi = savgol_filter(self.hsi, window_length=5, polyorder=2, axis=2)
-        self._mask_channel = self._channel.copy()
-        self._mask_channel[~self._mask] = 0
+    def savgol(self, window_length: int = 5, polyorder: int = 2, deriv: int = 0, masked: bool = False):
+        # Фильтр Савицкого-Голея для сглаживания спектров (masked - только пиксели маски)
+        # Шаг конвейера ленивый: каналы сглаживаются при обращении, исходный куб не меняется
+        # (время сглаживания - в профиле 'pipeline.smooth')
+        mask, mask_key = (self._mask, self._mask_key) if masked and hasattr(self, '_mask') else (None, None)
+        self.pipeline.replace(Smooth(window_length, polyorder, deriv, mask, mask_key))
+
+    def reset_filter(self):
+        # Отключить сглаживание (ранее вычисленные результаты без фильтра берутся из кэша)
+        self.pipeline.remove('smooth')
+
+    @property
+    def hsi(self) -> np.ndarray[float] | LazyCube:
+        # Куб в отображаемой ориентации (без копирования; после шагов конвейера - ленивое представление)
+        if not self.pipeline.steps: return self.orientation.apply(self._data)
+        return LazyCube(self.region, self.native_shape, self.orientation)
+
+    @property
+    def native_shape(self) -> tuple[int, int, int]:
+        return (*self._data.shape[:2], self.pipeline.band_count())
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return self.orientation.shape(self.native_shape)
 
     @property
     def height(self):
-        return self.hsi.shape[0]
+        return self.shape[0]
     
     @property
     def width(self):
-        return self.hsi.shape[1]
+        return self.shape[1]
 
     @property
     def mask(self) -> np.ndarray[bool]:
         if not hasattr(self, '_mask'):
-            self._mask = np.ones((self.height, self.width), dtype=bool)
-            self._mask_channel = self._channel
-        return self._mask
+            self._mask = np.ones(self._data.shape[:2], dtype=bool)
+            self._mask_key = ('', self.data_key)
+        return self.orientation.apply(self._mask)
     
     @mask.setter
+    @profiler.timed('mask')
     def mask(self, mask: np.ndarray[bool]):
-        self._mask = mask.copy()
-        self._mask_channel = self._channel.copy()
-        self._mask_channel[~self._mask] = 0
-        self._mask_hsi = self.hsi.copy()
-        self._mask_hsi[~self._mask, :] = 0
+        # Хранится только булева маска, куб не копируется (фон зануляется при обращении);
+        # ключ - номер маски, поэтому интегральные изображения и кэши по маске используются повторно
+        self._mask = self.orientation.invert(mask).copy()
+        self.mask_version += 1
+        self._mask_key = ('mask', self.mask_version, self.data_key)
 
     @property
     def wavelengths(self) -> np.ndarray[int]:
-        return self.parser.wave
+        return self.pipeline.wavelengths(self.parser.wave)
 
     @property
     def channel(self) -> np.ndarray[float]:
-        return self._channel
+        return self.orientation.apply(self._channel)
     
     @channel.setter
     def channel(self, channel: np.ndarray[float]):
-        self._channel = channel.copy()
-        self._mask_channel[self.mask] = self._channel[self.mask]
+        self._channel = self.orientation.invert(channel).copy()
+        self._channel_key = None
+
+    @property
+    def mask_channel_key(self) -> tuple | None:
+        # Ключ канала с зануленным фоном: (ключ канала, ключ маски), None - если канал задан извне
+        self.mask
+        if self._channel_key is None or self._mask_key is None: return None
+        return (self._channel_key, self._mask_key)
     
     @property
     def mask_channel(self):
-        if not hasattr(self, '_mask_channel'):
-            self._mask_channel = self._channel.copy()
-        return self._mask_channel
+        # Канал с зануленным фоном (вычисляется на лету)
+        self.mask
+        return self.orientation.apply(np.where(self._mask, self._channel, 0))
     
-    @property
-    def mask_hsi(self):
-        if not hasattr(self, '_mask_hsi'):
-            self._mask_hsi = self.hsi.copy()
-            self._mask_hsi[~self._mask, :] = 0
-        return self._mask_hsi
+    def masked(self, data: np.ndarray[float], x0: int = 0, y0: int = 0) -> np.ndarray[float]:
+        # Зануление фона в блоке куба исходной раскладки с началом в (x0, y0)
+        self.mask
+        h, w = data.shape[:2]
+        mask = self._mask[y0:y0+h, x0:x0+w]
+        return np.where(mask[:, :, None], data, 0)
     
     @property
     def parser(self) -> Parser:
@@ -98,21 +302,119 @@ class HSI:
     
     @property
     def rgb(self) -> np.ndarray[float]:
-        return self.hsi[:, :, self.RGB_BANDS]
+        return self.orientation.apply(np.dstack(self.bands(self.RGB_BANDS)))
     
     def mean_sign(self, data: np.ndarray[float] | None = None) -> np.ndarray[float]:
         # Вычислить средний спектр по внутренним или внешним данным
-        if data is None: data = self.mask_hsi
+        if data is None: return self.masked_mean()
         return data.mean(axis=(0, 1))
+
+    def masked_mean(self, box: tuple[int, int, int, int] | None = None) -> np.ndarray[float]:
+        # Средний спектр по пикселям маски (фон не учитывается) без копии куба,
+        # полосами строк в пределах TILE_BYTES; box - прямоугольник (x0, y0, x1, y1) в экранных координатах
+        self.mask
+        h, w = self._data.shape[:2]
+        x0, y0, x1, y1 = (0, 0, w, h) if box is None else self.orientation.box_to_native(*box, self._data.shape)
+        total, count = np.zeros(self.native_shape[2]), 0
+        tiles = row_tiles(y1 - y0, self.tile_rows())
+        for done, tile in enumerate(tiles, 1):
+            rows = slice(y0 + tile.start, y0 + tile.stop)
+            mask = self._mask[rows, x0:x1]
+            if mask.any():
+                total += self.region(rows, slice(x0, x1))[mask].sum(axis=0, dtype=float)
+                count += int(mask.sum())
+            Progress.report(done, len(tiles))
+        return total / count if count else total
+
+    @property
+    def integral_key(self) -> tuple:
+        self.mask
+        return (self.data_key, self._mask_key)
+
+    @property
+    def integral_ready(self) -> bool:
+        integral: SummedArea | None = getattr(self, '_integral', None)
+        return integral is not None and integral.key == self.integral_key
+
+    def request_integral(self):
+        # Построить интегральные изображения через schedule (один раз на версию данных и маски)
+        key = self.integral_key
+        if getattr(self, '_integral_request', None) == key: return
+        self._integral_request = key
+        self.schedule(lambda: self.integral)
+
+    @property
+    def integral(self) -> SummedArea:
+        # Интегральные изображения текущих данных и маски (строятся один раз на версию данных и маски)
+        key = self.integral_key
+        integral: SummedArea | None = getattr(self, '_integral', None)
+        if integral is None or integral.key != key:
+            self._integral = None # Освобождаем память прежних таблиц до построения новых
+            h, w, b = self.native_shape
+            allocate = self.integral_file(integral, SummedArea.nbytes(h, w, b) > self.INTEGRAL_BYTES)
+            del integral
+            self._integral = SummedArea(self.region, self._mask, b, rows=self.tile_rows(), key=key, allocate=allocate)
+        return self._integral
+
+    def integral_file(self, previous: SummedArea | None, large: bool) -> Callable[[tuple, np.dtype], np.memmap] | None:
+        # Большие таблицы - на диске: файл прежней таблицы того же размера перезаписывается,
+        # ненужный файл удаляется (иначе каждая новая маска оставляла бы на диске копию размером ~2 куба)
+        sums = previous.sums if previous is not None and isinstance(previous.sums, np.memmap) else None
+        del previous
+
+        def allocate(shape: tuple, dtype: np.dtype) -> np.memmap:
+            nonlocal sums
+            if sums is not None and sums.shape == shape and sums.dtype == dtype: return sums
+            if sums is not None:
+                path, sums = sums.filename, None
+                self.scratch.release(path)
+            return self.scratch.array('integral', shape, dtype)
+
+        if large: return allocate
+        if sums is not None:
+            path, sums = sums.filename, None
+            self.scratch.release(path)
+        return None
+
+    def roi_pixels(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray[float]:
+        # Спектры пикселей маски в прямоугольнике (экранные координаты) -> (n, bands)
+        x0, y0, x1, y1 = self.orientation.box_to_native(x0, y0, x1, y1, self._data.shape)
+        self.mask
+        return self.region(slice(y0, y1), slice(x0, x1))[self._mask[y0:y1, x0:x1]]
+
+    def roi_matrix(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray[float]:
+        # Среднее матриц ND отдельных пикселей маски в прямоугольнике (экранные координаты),
+        # в отличие от mean_matrix(roi_mean(...)) - матрицы среднего спектра
+        return mean_nd_matrix(self.roi_pixels(x0, y0, x1, y1))
+
+    def roi_mean(self, x0: int, y0: int, x1: int, y1: int) -> np.ndarray[float]:
+        # Средний спектр пикселей маски в прямоугольнике (экранные координаты) за O(каналов)
+        # по интегральным изображениям; если они строятся в фоне (schedule) - прямым суммированием прямоугольника.
+        # Прямоугольник обрезается по изображению, пустой - спектр из NaN
+        h, w = self.shape[:2]
+        x0, x1 = (min(max(int(x), 0), w) for x in (x0, x1))
+        y0, y1 = (min(max(int(y), 0), h) for y in (y0, y1))
+        if x0 >= x1 or y0 >= y1: return np.full(self.native_shape[2], np.nan)
+        if self.schedule is not None and not self.integral_ready:
+            self.request_integral()
+            return self.masked_mean((x0, y0, x1, y1))
+        x0, y0, x1, y1 = self.orientation.box_to_native(x0, y0, x1, y1, self._data.shape)
+        return self.integral.mean(x0, y0, x1, y1)
     
     @staticmethod
     def mean_matrix(spectre: np.ndarray[float]) -> np.ndarray[float]:
         x, y = np.meshgrid(spectre, spectre)
         return np.fromfunction(lambda i, j: (x-y) / (x+y), (204, 204))
     
+    def spectre(self, x: int, y: int) -> np.ndarray[float]:
+        # Спектр пикселя по экранным координатам (читается из исходной раскладки)
+        y, x = self.orientation.to_native(y, x, self._data.shape)
+        return self.region(slice(y, y+1), slice(x, x+1))[0, 0]
+
     def deep_roi(self, x0, y0, x1, y1):
-        # Получить срез куба HSI
-        return self.mask_hsi[y0:y1, x0:x1]
+        # Получить срез куба HSI с зануленным фоном (координаты экранные, срез берется из исходной раскладки)
+        x0, y0, x1, y1 = self.orientation.box_to_native(x0, y0, x1, y1, self._data.shape)
+        return self.orientation.apply(self.masked(self.region(slice(y0, y1), slice(x0, x1)), x0, y0))
     
 
 def main():
@@ -8,16 +8,18 @@ from matplotlib.image import AxesImage
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from PyQt6.QtWidgets import QLineEdit
 
+from .Interactive.Medium.Elementary.creator import Creator
 from .Interactive.Medium.Elementary.window import RunningWindow
 from .Interactive.Medium.Elementary.style import *
 from .hsi import HSI
 
 class MeanSign(RunningWindow):
 
-    def __init__(self, hsi: HSI, ax_in: plt.Axes, ax_out: list[plt.Axes] | None = None):
+    def __init__(self, hsi: HSI, ax_in: plt.Axes, ax_out: list[plt.Axes] | None = None, pixelwise: bool = False):
         super().__init__(ax_in)
         self.create_subplots(ax_out)
         self.hsi = hsi
+        self._pixelwise = pixelwise # Матрица ND - среднее по пикселям ROI, а не по среднему спектру
         self.create_mean_sign()
         self.create_mean_matrix()
         self.create_input()
@@ -89,7 +91,16 @@ class MeanSign(RunningWindow):
 
     def create_spectre(self):
         # Высислить средний спектр для текущего прямоугольника
-        self.spectre = self.hsi.mean_sign(self.deep_roi)
+        self.spectre = self.get_roi_spectre(self.points)
+
+    def get_roi_spectre(self, points: tuple[int, int, int, int]) -> np.ndarray[float]:
+        # Средний спектр пикселей маски в прямоугольнике по интегральным изображениям HSI (без чтения данных
+        # под прямоугольником; пока они строятся в фоне - по данным прямоугольника);
+        # пустой прямоугольник - средний спектр всего HSI
+        x0, y0, x1, y1 = points
+        if x0 != x1 and y0 != y1:
+            return self.hsi.roi_mean(x0, y0, x1, y1)
+        return self.hsi.mean_sign()
 
     def get_spectre(self, deep_roi: np.ndarray[float]) -> np.ndarray[float]:
         # Вычислить средний спектр
@@ -99,12 +110,20 @@ class MeanSign(RunningWindow):
         # Вычислить матрицу по среднему спектру
         return self.hsi.mean_matrix(spectre)
 
+    def get_roi_matrix(self, points: tuple[int, int, int, int], spectre: np.ndarray[float]) -> np.ndarray[float]:
+        # Матрица ND прямоугольника: в режиме pixelwise - среднее матриц пикселей маски,
+        # иначе (и для пустого прямоугольника) - матрица среднего спектра
+        x0, y0, x1, y1 = points
+        if self.pixelwise and x0 != x1 and y0 != y1:
+            return self.hsi.roi_matrix(x0, y0, x1, y1)
+        return self.get_matrix(spectre)
+
     ########################################
 
     def update_actors(self):
         self.create_spectre()
         self.ms = self.spectre
-        self.mx = self.matrix
+        self.mx = self.get_roi_matrix(self.points, self.spectre)
         
         # Меняем границы cmap и colorbar
         self._mx.set_clim([self.mx.get_array().min(), self.mx.get_array().max()])
@@ -144,6 +163,17 @@ class MeanSign(RunningWindow):
         if self.spectre is None: return
         return self.hsi.mean_matrix(self.spectre)
     
+    @property
+    def pixelwise(self) -> bool:
+        return self._pixelwise
+
+    @pixelwise.setter
+    def pixelwise(self, pixelwise: bool):
+        self._pixelwise = pixelwise
+        if self.rectangle is None: return
+        self.update_actors()
+        self.draw_all()
+
     @property
     def ms(self):
         return self._ms
@@ -160,7 +190,7 @@ class MeanSign(RunningWindow):
     
     @mx.setter
     def mx(self, matrix: np.ndarray[float]):
-        self._mx.set_data(matrix)
+        Creator.set_data(self._mx, matrix)
 
     ########################################
 
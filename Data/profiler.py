@@ -0,0 +1,159 @@
+import os
+import csv
+import json
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+from typing import Callable, Iterator
+
+import numpy as np
+
+class Profiler:
+    # Встроенный профилировщик: именованные таймеры и счетчики байтов.
+    # Выключен по умолчанию (включается переменной окружения HSI_PROFILE=1 или enabled = True),
+    # в выключенном состоянии обертки стоят одну проверку флага
+    WINDOW = 1024 # Сколько последних замеров хранится для гистограмм и перцентилей
+
+    def __init__(self, enabled: bool | None = None):
+        self.enabled = bool(os.environ.get('HSI_PROFILE')) if enabled is None else enabled
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples: dict[str, deque[tuple[float, float]]] = {} # имя -> (момент, мс)
+            self.counts: dict[str, int] = {}
+            self.totals: dict[str, float] = {} # мс
+            self.bytes: dict[str, int] = {}
+
+    ########################################
+
+    def record(self, name: str, ms: float):
+        with self.lock:
+            if name not in self.samples: self.samples[name] = deque(maxlen=self.WINDOW)
+            self.samples[name].append((perf_counter(), ms))
+            self.counts[name] = self.counts.get(name, 0) + 1
+            self.totals[name] = self.totals.get(name, 0.) + ms
+
+    def count_bytes(self, name: str, nbytes: int):
+        if not self.enabled: return
+        with self.lock:
+            self.bytes[name] = self.bytes.get(name, 0) + int(nbytes)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (perf_counter() - start) * 1000)
+
+    def timed(self, name: str) -> Callable[[Callable], Callable]:
+        # Декоратор: время каждого вызова записывается под именем name
+        def decorator(function: Callable) -> Callable:
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled: return function(*args, **kwargs)
+                start = perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(name, (perf_counter() - start) * 1000)
+            return wrapper
+        return decorator
+
+    ########################################
+
+    def window(self, name: str) -> np.ndarray[float]:
+        # Последние замеры (мс)
+        with self.lock:
+            return np.array([ms for _, ms in self.samples.get(name, ())])
+
+    def histogram(self, name: str, bins: int = 20) -> tuple[np.ndarray[int], np.ndarray[float]]:
+        # Гистограмма последних замеров: (число замеров, границы корзин в мс)
+        return np.histogram(self.window(name), bins=bins)
+
+    def rate(self, name: str, seconds: float = 1.) -> float:
+        # Частота вызовов за последние seconds секунд (напр. FPS для 'animated.step')
+        now = perf_counter()
+        with self.lock:
+            recent = sum(1 for moment, _ in self.samples.get(name, ()) if now - moment <= seconds)
+        return recent / seconds
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        # Сводка по всем именам: число вызовов, суммарное время, перцентили окна, байты
+        names = sorted(set(self.counts) | set(self.bytes))
+        stats = {}
+        for name in names:
+            window = self.window(name)
+            entry = {'count': self.counts.get(name, 0), 'total_ms': self.totals.get(name, 0.)}
+            if len(window):
+                entry |= {'mean_ms': float(window.mean()), 'p50_ms': float(np.percentile(window, 50)),
+                          'p95_ms': float(np.percentile(window, 95)), 'max_ms': float(window.max()),
+                          'last_ms': float(window[-1])}
+            if name in self.bytes: entry['bytes'] = self.bytes[name]
+            stats[name] = entry
+        return stats
+
+    def dump(self, path: str):
+        # Сохранить сводку в JSON или CSV (по расширению файла)
+        stats = self.stats()
+        if os.path.splitext(path)[1].lower() == '.csv':
+            columns = ['count', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms', 'last_ms', 'bytes']
+            with open(path, 'w', newline='', encoding='utf-8') as file:
+                writer = csv.writer(file)
+                writer.writerow(['name'] + columns)
+                for name, entry in stats.items():
+                    writer.writerow([name] + [entry.get(column, '') for column in columns])
+        else:
+            with open(path, 'w', encoding='utf-8') as file:
+                json.dump(stats, file, indent=2, ensure_ascii=False)
+
+    ########################################
+
+    def overlay(self, fig, names: tuple[str, ...] = ('animated.step', 'draw', 'calculate_channel'),
+                fps: str = 'animated.step', interval: int = 500) -> 'Overlay':
+        return Overlay(self, fig, names, fps, interval)
+
+class Overlay:
+    # Надпись поверх фигуры с FPS и задержками (p50/p95); обновляется таймером через blit
+    WIDTH = 40 # Фиксированная ширина строк: подложка не меняет размер и закрывает прежний текст
+
+    def __init__(self, profiler: Profiler, fig, names: tuple[str, ...], fps: str, interval: int):
+        self.profiler, self.fig, self.names, self.fps = profiler, fig, names, fps
+        self.text = fig.text(.01, .99, self.message(), va='top', ha='left', family='monospace', fontsize=7,
+                             color='lime', animated=True, bbox={'facecolor': 'black', 'alpha': 1, 'pad': 2})
+        self.cid = fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self.timer = fig.canvas.new_timer(interval=interval)
+        self.timer.add_callback(self.update)
+        self.timer.start()
+
+    def message(self) -> str:
+        lines = [f'FPS {self.profiler.rate(self.fps):5.1f}'.ljust(self.WIDTH)]
+        for name in self.names:
+            window = self.profiler.window(name)
+            if not len(window): continue
+            p50, p95 = np.percentile(window, (50, 95))
+            lines.append(f'{name[:18]:<18} {p50:7.1f} {p95:7.1f} ms'.ljust(self.WIDTH))
+        return '\n'.join(lines)
+
+    def on_draw(self, event):
+        self.fig.draw_artist(self.text)
+
+    def update(self):
+        self.text.set_text(self.message())
+        self.fig.draw_artist(self.text)
+        self.fig.canvas.blit(self.text.get_window_extent())
+
+    def remove(self):
+        self.timer.stop()
+        self.fig.canvas.mpl_disconnect(self.cid)
+        self.text.remove()
+        self.fig.canvas.draw_idle()
+
+profiler = Profiler()
@@ -0,0 +1,46 @@
+import threading
+from collections.abc import Callable
+
+class Cancelled(Exception):
+    # Задача отменена (напр. пользователь ввел новое выражение, пока считалось старое)
+    pass
+
+class Progress:
+    # Токен фоновой задачи: отчет о прогрессе и кооперативная отмена.
+    # Длительные циклы по тайлам вызывают Progress.report(done, total): в потоке с активным токеном
+    # (with token: ...) это обновляет прогресс и прерывает работу исключением Cancelled после cancel(),
+    # без токена - пустая операция
+    _local = threading.local()
+
+    def __init__(self, callback: Callable[[float], None] | None = None):
+        self.callback = callback # Доля выполненной работы 0..1 (вызывается из рабочего потока)
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def __call__(self, done: int, total: int):
+        if self.cancelled: raise Cancelled()
+        if self.callback is not None: self.callback(done / max(total, 1))
+
+    def __enter__(self) -> 'Progress':
+        if not hasattr(self._local, 'stack'): self._local.stack = []
+        self._local.stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        self._local.stack.pop()
+
+    @classmethod
+    def current(cls) -> 'Progress | None':
+        stack = getattr(cls._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    @classmethod
+    def report(cls, done: int, total: int):
+        token = cls.current()
+        if token is not None: token(done, total)
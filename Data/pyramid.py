@@ -0,0 +1,135 @@
+from collections.abc import Hashable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.image import AxesImage
+
+from .cache import LRUCache
+from .Interactive.Medium.Elementary.creator import Creator
+
+class Pyramid:
+    # Уменьшенные копии изображения: каждый уровень в 2 раза меньше предыдущего (пулинг 2x2),
+    # уровни строятся в фоне; пока строятся, доступны уже готовые
+    MIN_SIZE = 256 # Последний уровень - не меньше этого размера по большей стороне
+    POOLING = ('mean', 'max')
+
+    def __init__(self, img: np.ndarray, pooling: str = 'mean', executor: ThreadPoolExecutor | None = None):
+        if pooling not in self.POOLING: raise ValueError(f'Неизвестный пулинг: {pooling}')
+        self.pooling = pooling
+        self.levels: list[np.ndarray] = [img]
+        self.future: Future | None = executor.submit(self.build) if executor is not None else None
+        if executor is None: self.build()
+
+    def build(self):
+        while max(self.levels[-1].shape[:2]) >= 2 * self.MIN_SIZE:
+            self.levels.append(self.pool(self.levels[-1], self.pooling)) # append атомарен - уровни читаются из GUI
+
+    @staticmethod
+    def pool(img: np.ndarray, pooling: str = 'mean') -> np.ndarray:
+        # Пулинг 2x2 (нечетные последние строка/столбец отбрасываются)
+        h, w = img.shape[0] // 2, img.shape[1] // 2
+        blocks = img[:2*h, :2*w].reshape(h, 2, w, 2)
+        if pooling == 'max': return blocks.max(axis=(1, 3))
+        return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+    @property
+    def ready(self) -> bool:
+        return self.future is None or self.future.done()
+
+    def level(self, scale: float) -> tuple[int, np.ndarray]:
+        # Уровень для scale пикселей изображения на пиксель экрана (не грубее, чем нужно)
+        index = int(np.floor(np.log2(scale))) if scale > 1 else 0
+        index = min(index, len(self.levels) - 1)
+        return index, self.levels[index]
+
+class PyramidView:
+    # Отображение большого канала через пирамиду: показывается только видимая область (с запасом MARGIN)
+    # уровня, соответствующего масштабу; при приближении - исходное разрешение.
+    # Полноразмерное изображение остается в осях первым (скрытым): его данные используют режимы
+    # (Creator.data), цветовая шкала общая (norm)
+    MARGIN = .25 # Запас вокруг видимой области (доля ее размера) - панорамирование без пересчета
+    POLL = 100 # Период проверки готовности пирамиды, мс
+
+    def __init__(self, image: AxesImage, pooling: str = 'mean', cache_items: int = 4):
+        self.ax: plt.Axes = image.axes
+        self.image = image
+        self.pooling = pooling
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='pyramid')
+        self.pyramids = LRUCache(max_items=cache_items) # ключ канала -> пирамида
+        self.pyramid: Pyramid | None = None
+        self.window: tuple | None = None # (уровень, r0, r1, c0, c1) показанной области
+        self.previewing = False # Показан грубый кадр (preview) до прихода полного канала
+        self.timer = None
+
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        self.view = self.ax.imshow(np.zeros((1, 1), dtype=np.float32), cmap=image.get_cmap(), norm=image.norm)
+        self.image.set_visible(False)
+        self.ax.set_autoscale_on(False) # Смена extent не должна менять пределы осей
+        self.ax.set_xlim(xlim)
+        self.ax.set_ylim(ylim)
+        self.ax.callbacks.connect('xlim_changed', self.update)
+        self.ax.callbacks.connect('ylim_changed', self.update)
+
+    def set(self, img: np.ndarray, key: Hashable = None):
+        # Новый канал: пирамида берется из кэша по ключу канала или строится в фоне
+        pyramid = None if key is None else self.pyramids.get(key)
+        if pyramid is None:
+            pyramid = Pyramid(img, self.pooling, self.executor)
+            if key is not None: self.pyramids.put(key, pyramid, nbytes=0)
+        self.pyramid = pyramid
+        self.window = None
+        self.previewing = False
+        self.update()
+
+    def preview(self, img: np.ndarray):
+        # Грубый кадр (подвыборка канала) растягивается на все изображение; пределы осей не меняются,
+        # пирамида не перерисовывает его до следующего set
+        h, w = self.image.get_array().shape[:2]
+        self.previewing = True
+        self.window = None
+        Creator.set_data(self.view, img)
+        self.view.set_extent((-.5, w - .5, h - .5, -.5))
+
+    def restore(self):
+        # Вернуться от грубого кадра к пирамиде текущего канала (предпросмотр отменен или с ошибкой)
+        self.previewing = False
+        self.window = None
+        self.update()
+
+    def update(self, ax: plt.Axes | None = None):
+        if self.pyramid is None or self.previewing: return
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        scale = max((x1 - x0) / max(self.ax.bbox.width, 1), (y1 - y0) / max(self.ax.bbox.height, 1))
+        index, level = self.pyramid.level(scale)
+        step = 2 ** index
+
+        if self.window is not None and self.window[0] == index: # Видимая область внутри показанной
+            _, r0, r1, c0, c1 = self.window
+            if c0 * step - .5 <= x0 and x1 <= c1 * step - .5 and r0 * step - .5 <= y0 and y1 <= r1 * step - .5: return
+
+        mx, my = (x1 - x0) * self.MARGIN, (y1 - y0) * self.MARGIN
+        c0, c1 = max(int((x0 - mx + .5) // step), 0), min(int(np.ceil((x1 + mx + .5) / step)), level.shape[1])
+        r0, r1 = max(int((y0 - my + .5) // step), 0), min(int(np.ceil((y1 + my + .5) / step)), level.shape[0])
+        if c0 >= c1 or r0 >= r1: return
+
+        self.window = (index, r0, r1, c0, c1)
+        Creator.set_data(self.view, level[r0:r1, c0:c1])
+        self.view.set_extent((c0 * step - .5, c1 * step - .5, r1 * step - .5, r0 * step - .5))
+        if not self.pyramid.ready: self.poll()
+
+    def poll(self):
+        # Пирамида еще строится: проверить позже и перейти на более грубый уровень, когда он появится
+        if self.timer is not None: return
+        self.timer = self.ax.figure.canvas.new_timer(interval=self.POLL)
+        self.timer.single_shot = True
+        self.timer.add_callback(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        self.timer = None
+        window = self.window
+        self.window = None
+        self.update()
+        if self.window != window: self.ax.figure.canvas.draw_idle()
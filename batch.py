@@ -0,0 +1,87 @@
+import os
+import sys
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from Data import export
+from Data.hsi import HSI
+
+def find_files(inputs: list[str]) -> list[str]:
+    # Папки и шаблоны -> список заголовков .hdr
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            files += sorted(glob.glob(os.path.join(item, '*.hdr')))
+        else:
+            files += sorted(glob.glob(item))
+    return list(dict.fromkeys(files))
+
+def parse_roi(text: str) -> tuple[int, int, int, int]:
+    # 'x0,y0,x1,y1' -> (x0, y0, x1, y1)
+    x0, y0, x1, y1 = map(int, text.split(','))
+    return x0, y0, x1, y1
+
+def process(path: str, expressions: list[str], threshold: str | None,
+            rois: list[tuple[int, int, int, int]], output: str, cache_bytes: int) -> dict:
+    # Обработка одного файла (выполняется в отдельном процессе)
+    start = time.perf_counter()
+    hsi = HSI(memory=cache_bytes) # Ограничение памяти процесса
+    hsi.evaluator.workers = 1 # Параллелизм - на уровне процессов
+    hsi.load(path)
+
+    if threshold: hsi.calculate_channel(threshold)
+    stem = os.path.join(output, os.path.splitext(os.path.basename(path))[0])
+
+    if expressions:
+        indices = hsi.calculate_channels(expressions, masked=bool(threshold))
+        export.save_npy(f'{stem}_indices.npy', indices) # Полосами: индексы могут быть на диске (out-of-core)
+
+    if rois:
+        # Несколько ROI - прямым суммированием прямоугольников, без интегральных изображений всего куба
+        spectra = np.stack([hsi.masked_mean(roi) for roi in rois]).astype(np.float32)
+        np.savez(f'{stem}_roi.npz', roi=np.array(rois), spectre=spectra, wavelengths=hsi.wavelengths)
+
+    return {'path': path, 'bytes': hsi.cube.nbytes, 'time': time.perf_counter() - start}
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description='Пакетная обработка HSI без интерфейса')
+    parser.add_argument('inputs', nargs='+', help='папки с .hdr или шаблоны путей')
+    parser.add_argument('-e', '--expression', action='append', default=[], help='индекс, напр. "(b70-b30)/(b70+b30)"')
+    parser.add_argument('-t', '--threshold', help='условие для маски, напр. "b70 > 0.3"')
+    parser.add_argument('-r', '--roi', action='append', default=[], type=parse_roi, help='ROI "x0,y0,x1,y1"')
+    parser.add_argument('-o', '--output', default='output', help='папка для результатов')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='число процессов')
+    parser.add_argument('--memory', type=int, default=512, help='бюджет памяти одного процесса (кэши, интегральные изображения, полосы), МБ')
+    args = parser.parse_args(argv)
+
+    files = find_files(args.inputs)
+    if not files: sys.exit('Файлы .hdr не найдены')
+    os.makedirs(args.output, exist_ok=True)
+
+    start = time.perf_counter()
+    done, failed, total_bytes = 0, 0, 0
+    # max_tasks_per_child: процессы перезапускаются, чтобы память не накапливалась
+    with ProcessPoolExecutor(args.workers, max_tasks_per_child=8) as pool:
+        futures = {pool.submit(process, path, args.expression, args.threshold, args.roi,
+                               args.output, args.memory * 2**20): path for path in files}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as error:
+                failed += 1
+                print(f'[{done + failed}/{len(files)}] {futures[future]}: ошибка {error!r}', file=sys.stderr)
+                continue
+            done += 1
+            total_bytes += result['bytes']
+            print(f'[{done + failed}/{len(files)}] {result["path"]}: {result["time"]:.2f} с')
+
+    elapsed = time.perf_counter() - start
+    print(f'Обработано {done} из {len(files)} файлов ({failed} с ошибками) за {elapsed:.1f} с: '
+          f'{done / elapsed:.2f} файл/с, {total_bytes / 2**20 / elapsed:.1f} МБ/с')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+from collections.abc import Callable
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg') # Без окон Qt
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import MouseEvent
+
+from Data import export
+from Data.hsi import HSI
+from Data.Cube.envi import EnviCube
+from Data.Cube.tiles import row_tiles, tile_rows
+from Data.Interactive.Medium.lumen import Lumen
+
+SIZES = (256, 512, 1024)
+BANDS = 204
+EXPRESSION = '(b150 - b70) / (b150 + b70)'
+THRESHOLD = 'b150 > 0.3' # Лист синтетического куба ярче почвы в ближнем ИК
+
+class Skip(Exception):
+    # Замер невозможен в текущем окружении (нет PyQt6, pandas и т.п.)
+    pass
+
+def synthetic_cube(directory: str, size: int, bands: int = BANDS, seed: int = 0) -> str:
+    # Детерминированный куб size x size x bands: почва + 'лист' (эллипс) с пятном поражения и шумом.
+    # Пишется полосами строк, поэтому большие кубы не требуют памяти под весь объем
+    path = os.path.join(directory, f'synthetic_{size}x{size}x{bands}.hdr')
+    if os.path.exists(path): return path
+
+    wave = np.linspace(400, 1000, bands)
+    soil = (.1 + .15 * (wave - 400) / 600).astype(np.float32)
+    leaf = (.05 + .45 / (1 + np.exp(-(wave - 715) / 15)) + .08 * np.exp(-((wave - 550) / 30) ** 2)).astype(np.float32)
+
+    cube = EnviCube.create(path, (size, size, bands), np.float32, wavelengths=wave)
+    rng = np.random.default_rng(seed)
+    x = np.arange(size)[None]
+    for rows in row_tiles(size, tile_rows(size * bands * 4, 64 * 2**20)):
+        y = np.arange(rows.start, rows.stop)[:, None]
+        inside = ((y - size / 2) / (.35 * size)) ** 2 + ((x - size / 2) / (.25 * size)) ** 2 < 1
+        spot = (y - .4 * size) ** 2 + (x - .55 * size) ** 2 < (.06 * size) ** 2
+        block = np.where(inside[..., None], leaf, soil)
+        block[spot & inside] *= .8
+        block += rng.normal(0, .01, block.shape).astype(np.float32)
+        cube.data[rows] = block
+    cube.raw.flush()
+    return path
+
+def measure(function: Callable[[], object], repeat: int, setup: Callable[[], object] | None = None) -> dict[str, float]:
+    times = []
+    for _ in range(repeat):
+        if setup is not None: setup()
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {'min_ms': min(times), 'median_ms': statistics.median(times), 'repeat': repeat}
+
+########################################
+
+def qt_app():
+    # QLineEdit режимов требует QApplication; окна не показываются (платформа offscreen)
+    try:
+        from PyQt6.QtWidgets import QApplication
+    except ImportError as error:
+        raise Skip(str(error))
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return QApplication.instance() or QApplication([])
+
+def drag(creator, ax: plt.Axes, points: list[tuple[float, float]], button: int = 1):
+    # Нажатие, движения мыши по точкам и отпускание (на Agg движения обрабатываются синхронно)
+    fig = ax.figure
+    def event(name: str, x: float, y: float) -> MouseEvent:
+        px, py = ax.transData.transform((x, y))
+        return MouseEvent(name, fig.canvas, px, py, button=button)
+
+    creator.click(event('button_press_event', *points[0]))
+    for point in points[1:]:
+        creator.move(event('motion_notify_event', *point))
+    creator.release(event('button_release_event', *points[-1]))
+
+def drag_path(size: int, steps: int = 20) -> list[tuple[float, float]]:
+    # Диагональ от 1/4 до 1/2 изображения
+    return [(size / 4 + i * size / 4 / steps, size / 4 + i * size / 4 / steps) for i in range(steps + 1)]
+
+def channel_axes(hsi: HSI) -> plt.Axes:
+    fig, ax = plt.subplots()
+    ax.imshow(hsi.mask_channel)
+    ax.axis('off')
+    fig.canvas.draw()
+    return ax
+
+########################################
+
+def benchmarks(hsi: HSI, path: str, size: int) -> dict[str, tuple[Callable, Callable | None]]:
+    # Имя -> (замеряемая функция, подготовка перед каждым повтором)
+    def cold():
+        # Сбросить кэши каналов, результатов, парсера и конвейера
+        hsi.cube.cache.clear()
+        hsi.results.clear()
+        hsi.stored.clear()
+        hsi.parser.cache.clear()
+        hsi.pipeline.cache.clear()
+
+    def savgol_setup():
+        hsi.reset_filter()
+        cold()
+
+    def savgol():
+        hsi.savgol()
+        hsi.calculate_channel('b70')
+
+    def drop_integral():
+        hsi._integral = None
+
+    side = max(1, min(64, size // 2)) # ROI до 64 пикселей, целиком внутри куба любого размера
+    roi = (size // 4, size // 4, size // 4 + side, size // 4 + side)
+    spectre = hsi.mean_sign()
+
+    lumen_mode = Lumen(hsi.hsi, channel_axes(hsi))
+    def lumen():
+        for x, y in drag_path(size, 100):
+            lumen_mode.get_lumen(x, y)
+
+    def drag_lumen():
+        ax = channel_axes(hsi)
+        drag(Lumen(hsi.hsi, ax), ax, drag_path(size))
+        plt.close('all')
+
+    def drag_mean_sign():
+        qt_app()
+        from Data.mean_sign import MeanSign
+        ax = channel_axes(hsi)
+        drag(MeanSign(hsi, ax), ax, drag_path(size))
+        plt.close('all')
+
+    def drag_lim_slice():
+        qt_app()
+        from Data.Interactive.lim_slice import LimSlice
+        ax = channel_axes(hsi)
+        drag(LimSlice(ax), ax, drag_path(size))
+        plt.close('all')
+
+    def excel(directory: str):
+        # Те же таблицы, что Interface.save_index и save_mode_3 для одного ROI
+        try:
+            import pandas as pd
+            import openpyxl
+        except ImportError as error:
+            raise Skip(str(error))
+        with pd.ExcelWriter(os.path.join(directory, 'index.xlsx'), engine='openpyxl') as writer:
+            pd.DataFrame(hsi.channel).to_excel(writer, sheet_name='Индекс')
+        with pd.ExcelWriter(os.path.join(directory, 'mode_3.xlsx'), engine='openpyxl') as writer:
+            spectre = hsi.roi_mean(*roi)
+            pd.DataFrame(HSI.mean_matrix(spectre)).to_excel(writer, sheet_name='matrix_0')
+            pd.DataFrame([spectre], columns=hsi.wavelengths).to_excel(writer, sheet_name='mean_spectre')
+
+    directory = os.path.dirname(path)
+    return {
+        'load': (lambda: HSI().load(path), None),
+        'calculate_channel': (lambda: hsi.calculate_channel(EXPRESSION), cold),
+        'calculate_channel_cached': (lambda: hsi.calculate_channel(EXPRESSION), None),
+        'mask': (lambda: (hsi.calculate_channel(THRESHOLD), hsi.mask_channel), cold),
+        'savgol': (savgol, savgol_setup),
+        'mean_sign': (hsi.mean_sign, None),
+        'mean_matrix': (lambda: HSI.mean_matrix(spectre), None),
+        'integral': (lambda: hsi.roi_mean(*roi), drop_integral),
+        'roi_mean': (lambda: hsi.roi_mean(*roi), None),
+        'roi_matrix': (lambda: hsi.roi_matrix(*roi), None),
+        'lumen': (lumen, None),
+        'drag_lumen': (drag_lumen, None),
+        'drag_mean_sign': (drag_mean_sign, None),
+        'drag_lim_slice': (drag_lim_slice, None),
+        'excel': (lambda: excel(directory), None),
+        'export_npy': (lambda: export.save(os.path.join(directory, 'index.npy'), {'index': hsi.channel}), None),
+        'export_envi': (lambda: export.save(os.path.join(directory, 'index.hdr'), {'index': hsi.channel}), None),
+    }
+
+def run(sizes: list[int], repeat: int, directory: str, only: list[str] | None = None) -> dict:
+    results, skipped = {}, {}
+    for size in sizes:
+        path = synthetic_cube(directory, size)
+        hsi = HSI()
+        hsi.load(path)
+        hsi.calculate_channel(THRESHOLD) # Маска для режимов и средних
+        hsi.calculate_channel(EXPRESSION)
+
+        for name, (function, setup) in benchmarks(hsi, path, size).items():
+            if only and name not in only: continue
+            key = f'{size}/{name}'
+            try:
+                results[key] = measure(function, repeat, setup)
+                print(f'{key:<32} {results[key]["median_ms"]:10.2f} ms', flush=True)
+            except Skip as error:
+                skipped[key] = str(error)
+                print(f'{key:<32} пропущено: {error}', flush=True)
+            hsi.reset_filter()
+            hsi.calculate_channel(THRESHOLD)
+            hsi.calculate_channel(EXPRESSION)
+        plt.close('all')
+
+    meta = {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+            'numpy': np.__version__, 'matplotlib': matplotlib.__version__, 'platform': platform.platform(),
+            'cpus': os.cpu_count(), 'sizes': sizes, 'bands': BANDS, 'repeat': repeat}
+    return {'meta': meta, 'results': results, 'skipped': skipped}
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    # Сравнение медиан двух запусков; регрессия - замедление больше чем в (1 + threshold) раз
+    regressions = []
+    print(f'{"замер":<32} {"было, мс":>10} {"стало, мс":>10} {"отношение":>10}')
+    for key in sorted(set(old['results']) & set(new['results'])):
+        before, after = old['results'][key]['median_ms'], new['results'][key]['median_ms']
+        ratio = after / before if before else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            regressions.append(key)
+            flag = '  <- регрессия'
+        print(f'{key:<32} {before:10.2f} {after:10.2f} {ratio:10.2f}{flag}')
+    return regressions
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description='Замеры производительности на синтетических кубах (без интерфейса)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='выполнить замеры и сохранить JSON')
+    run_parser.add_argument('-s', '--sizes', type=int, nargs='+', default=list(SIZES), help='стороны кубов, напр. 256 512 2048')
+    run_parser.add_argument('-r', '--repeat', type=int, default=5, help='число повторов каждого замера')
+    run_parser.add_argument('-b', '--benchmark', action='append', help='только указанные замеры')
+    run_parser.add_argument('-d', '--directory', help='папка для синтетических кубов (по умолчанию временная)')
+    run_parser.add_argument('-o', '--output', default='benchmark.json', help='файл результатов')
+
+    compare_parser = commands.add_parser('compare', help='сравнить два файла результатов')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('-t', '--threshold', type=float, default=.2, help='допустимое замедление (.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    match args.command:
+        case 'run':
+            if args.directory:
+                os.makedirs(args.directory, exist_ok=True)
+                report = run(args.sizes, args.repeat, args.directory, args.benchmark)
+            else:
+                with tempfile.TemporaryDirectory(prefix='hsi_bench_') as directory:
+                    report = run(args.sizes, args.repeat, directory, args.benchmark)
+            with open(args.output, 'w', encoding='utf-8') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            print(f'Результаты: {args.output}')
+
+        case 'compare':
+            with open(args.old, encoding='utf-8') as file: old = json.load(file)
+            with open(args.new, encoding='utf-8') as file: new = json.load(file)
+            regressions = compare(old, new, args.threshold)
+            if regressions:
+                print(f'Регрессий: {len(regressions)}')
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -2,20 +2,34 @@ import sys
 from functools import partial
 from collections.abc import Callable
 
+import numpy as np
 import pandas as pd
 from PyQt6 import QtWidgets as QW
 from PyQt6.QtGui import QIcon, QAction
+from PyQt6.QtCore import QTimer
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as Toolbar
 from mpl_interactions import zoom_factory
 
 from plot import Plot
+from tasks import TaskRunner
+from Data.progress import Progress
+from Data import export
+from Data.profiler import profiler
 from Data.Interactive.Medium.Elementary.style import *
 
 class Interface(QW.QMainWindow):
+    PREVIEW_DELAY = 300 # Пауза ввода перед предпросмотром, мс
+    PREVIEW_STRIDE = 8 # Шаг подвыборки пикселей грубого кадра
+    INDEX_FORMATS = ('.npy', '.npz', '.hdr', '.parquet', '.csv', '.xlsx') # Первый - по умолчанию в диалоге
+    TABLE_FORMATS = ('.xlsx', '.npz', '.npy', '.parquet', '.csv')
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("HSI Editor")
         self.plot = Plot()
+        self.tasks = TaskRunner(self) # Тяжелые вычисления вне потока GUI
+        self.plot.hsi.schedule = partial(self.tasks.submit, 'Интегральные изображения') # ROI без ожидания таблиц
+        self.live = True # Предпросмотр выражения при вводе
         self.open()
 
         zoom_factory(self.plot.ax_in)
@@ -27,6 +41,9 @@ class Interface(QW.QMainWindow):
         # Панель инструментов
         self._create_toolbar()
 
+        # Прогресс фоновых вычислений
+        self._create_statusbar()
+
         # Элементы меню
         menu = self.menuBar()
         self._create_menu_file(menu)
@@ -52,10 +69,23 @@ class Interface(QW.QMainWindow):
         
         self.input.returnPressed.connect(self.parse) # self.input.setFocus()
         self.editToolBar.addWidget(self.input)
+
+        # Предпросмотр: после паузы ввода (каждое нажатие перезапускает таймер)
+        self.debounce = QTimer(self, singleShot=True, interval=self.PREVIEW_DELAY)
+        self.debounce.timeout.connect(self.preview)
+        self.input.textEdited.connect(lambda text: self.debounce.start() if self.live else None)
     
+    def _create_statusbar(self):
+        self.progress = QW.QProgressBar(maximum=100, maximumWidth=200, visible=False)
+        self.statusBar().addPermanentWidget(self.progress)
+        self.tasks.progress.connect(lambda name, fraction: self.progress.setValue(round(100 * fraction)))
+        self.tasks.running.connect(self.progress.setVisible)
+        self.tasks.busy.connect(self.block_modes)
+        self.tasks.failed.connect(lambda name, error: QW.QMessageBox.warning(self, name, error))
+
     def _add_menu_item(self, menu: QW.QMenu, title: str, function: Callable[[], None]):
         item = QAction(QIcon('1.png'), f'&{title}', self)
-        item.triggered.connect(function)
+        item.triggered.connect(lambda: function()) # Без аргумента checked (обертки профилировщика)
         menu.addAction(item)
 
     def _add_menu(self, parent_menu: QW.QMenu, title: str) -> QW.QMenu:
@@ -71,6 +101,8 @@ class Interface(QW.QMainWindow):
         add_menu_file(title='Открыть', function=self.open)
         add_menu_file(title='Сохранить индекс', function=self.save_index)
         add_menu_file(title='Сохранить результаты', function=self.save)
+        add_menu_file(title='Профилирование вкл/выкл', function=self.toggle_profiler)
+        add_menu_file(title='Сохранить статистику профилирования', function=self.save_profile)
 
     def _create_menu_edit(self, menu: QW.QMenuBar):
         # Edit
@@ -78,13 +110,18 @@ class Interface(QW.QMainWindow):
         add_edit_item = partial(self._add_menu_item, menu=edit)
         
         add_edit_item(title='RGB', function=self.plot.rgb)
-        add_edit_item(title='Повернуть', function=self.plot.rotate)
+        add_edit_item(title='Повернуть', function=self.rotate)
         add_edit_item(title='Отобразить в 3D', function=self.plot.surface)
-        add_edit_item(title='Фильтр Савицкого-Голея', function=self.plot.filter)
+        add_edit_item(title='Фильтр Савицкого-Голея', function=self.filter)
+        add_edit_item(title='Фильтр Савицкого-Голея (по маске)', function=lambda : self.filter(masked=True))
+        add_edit_item(title='Отменить фильтр', function=lambda : self.refresh(self.plot.hsi.reset_filter))
+        add_edit_item(title='Матрица ND по пикселям / по среднему спектру', function=self.plot.toggle_pixelwise)
+        add_edit_item(title='Предпросмотр при вводе вкл/выкл', function=self.toggle_live)
 
     def _create_menu_tools(self, menu: QW.QMenuBar):
         # Tools
         tools = menu.addMenu('&Режимы')
+        self.tools = tools
         add_menu_tools = partial(self._add_menu_item, menu=tools)
 
         def create_hbox():
@@ -98,6 +135,15 @@ class Interface(QW.QMainWindow):
         add_menu_tools(title='Средний спектр', function=lambda : self.check_mode(3))
         add_menu_tools(title='Срез данных', function=lambda : self.check_mode(1, create_hbox))
 
+    def block_modes(self, busy: bool):
+        # Пока фоновая задача меняет HSI (загрузка, поворот, фильтр, канал и маска), режимы его не читают:
+        # события мыши, поля ввода режима и выбор режима отключены
+        self.plot.canvas.setEnabled(not busy)
+        self.tools.setEnabled(not busy)
+        mode = self.plot.mode_object if self.plot.mode else None
+        for widget in (getattr(mode, 'input', None), getattr(getattr(mode, 'slice', None), 'input', None)):
+            if widget is not None: widget.setEnabled(not busy)
+
     def check_mode(self, num: int, create_hbox: Callable[[], QW.QHBoxLayout] | None = None):
         # Функция выбора режима под номером num
         # В функции create_hbox создается контейнер с доп элементами
@@ -140,25 +186,27 @@ class Interface(QW.QMainWindow):
         if not self.path and self.centralWidget() is None: sys.exit()
         if not self.path: return
 
-        self.plot.load_hsi(self.path)
-        # self.plot.load_hsi()
-        if self.centralWidget() is None:
+        if self.centralWidget() is None: # Первое открытие - до показа окна, режимам нужен готовый канал
+            self.plot.load_hsi(self.path)
             self._create_elements()
-        self.parse()
+            self.plot.redraw(self.input.text())
+            return
+        self.refresh(partial(self.plot.load_hsi, self.path), self.input.text())
 
     def save_index(self):
-        save_path = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_index', '.xlsx')
-        if not save_path[0]: return
-        with pd.ExcelWriter(''.join(save_path), engine='openpyxl') as writer:
-            pd.DataFrame(self.plot.hsi.channel).to_excel(writer, sheet_name=f'Индекс')
+        # Канал целиком - потоково в фоне (Excel - только для небольших каналов)
+        save_path, selected = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_index',
+                                                             export.file_filter(self.INDEX_FORMATS))
+        if not save_path: return
+        self.tasks.submit('Сохранение индекса', export.save, None, save_path, {'index': self.plot.hsi.channel},
+                          selected_filter=selected)
 
     def save_mode_1(self):
-        save_path = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_mode_1', '.xlsx')
-        if not save_path[0]: return
-        with pd.ExcelWriter(''.join(save_path), engine='openpyxl') as writer:
-            height = self.plot.mode_object.height
+        save_path, selected = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_mode_1',
+                                                             export.file_filter(self.TABLE_FORMATS))
+        if not save_path: return
+        with profiler.timer('save_mode_1'):
             data_roi = {'roi_id': [], 'x0': [], 'y0': [], 'x1': [], 'y1': [], 'area, pix': []}
-            data_lines = {'roi_id': [], 'x_abs': [], 'x': []} | {i: [] for i in range(height)}
 
             rectangles = self.plot.mode_object
             container = rectangles.slice.container
@@ -175,29 +223,25 @@ class Interface(QW.QMainWindow):
                 data_roi['x1'].append(x1)
                 data_roi['y1'].append(y1)
 
-                xlines = rectangles.slice.get_xlines(i) # Координаты линий
-                roi = rectangles.get_roi(x0, y0, x1, y1) # Данные под прямоугольником
-                
-                for x in xlines:
-                    data_lines['roi_id'].append(i)
-                    data_lines['x'].append(x)
-                    data_lines['x_abs'].append(x0 + x)
-
-                    roi_slice = roi[:, x]
-                    for k in range(height):
-                        data_lines[k].append(roi_slice[k] if k < len(roi_slice) else None)
-
-
-            pd.DataFrame(data_roi).to_excel(writer, sheet_name='roi')
-            pd.DataFrame(data_lines).to_excel(writer, sheet_name='slice')
+            # Срезы всех ROI одной выборкой: (roi_id, x_abs, x) и значения (срезы, высота), NaN ниже ROI
+            lines, values = rectangles.slices()
+            arrays = {'roi': export.table(data_roi)}
+            if export.extension(save_path, selected) == '.xlsx':
+                arrays['slice'] = np.hstack([lines, values])
+                columns = {'slice': ['roi_id', 'x_abs', 'x', *range(values.shape[1])]}
+            else:
+                arrays |= {'slice': export.table(dict(zip(('roi_id', 'x_abs', 'x'), lines.T))), 'values': values}
+                columns = {}
+            self.save_tables(save_path, arrays, columns=columns, selected_filter=selected)
 
     def save_mode_3(self):
-        save_path = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_mode_3', '.xlsx')
-        if not save_path[0]: return
-        with pd.ExcelWriter(''.join(save_path), engine='openpyxl') as writer:
+        save_path, selected = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_mode_3',
+                                                             export.file_filter(self.TABLE_FORMATS))
+        if not save_path: return
+        with profiler.timer('save_mode_3'):
             id = 'roi_id'
             data_roi = {id: [], 'x0': [], 'y0': [], 'x1': [], 'y1': [], 'area, pix': []}
-            data_ms = {id: []} | {nm_i: [] for nm_i in self.plot.hsi.wavelengths}
+            spectra, matrices = [], []
 
             mean_sign = self.plot.mode_object
             rectangles = mean_sign.rectangles
@@ -212,24 +256,24 @@ class Interface(QW.QMainWindow):
                 data_roi['x1'].append(x1)
                 data_roi['y1'].append(y1)
                 
-                deep_roi = mean_sign.get_deep_roi(rectangle)
-                spectre = mean_sign.get_spectre(deep_roi)
-                matrix = mean_sign.get_matrix(spectre)
-
-                data_ms[id].append(i)
-                for j, value in enumerate(spectre):
-                    data_ms[self.plot.hsi.wavelengths[j]].append(value)
-                
-                pd.DataFrame(matrix).to_excel(writer, sheet_name=f'matrix_{i}')
-                
-
-            pd.DataFrame(data_roi).to_excel(writer, sheet_name='roi')
-            pd.DataFrame(data_ms).to_excel(writer, sheet_name='mean_spectre')
+                spectre = mean_sign.get_roi_spectre((x0, y0, x1, y1))
+                spectra.append(spectre)
+                matrices.append(mean_sign.get_roi_matrix((x0, y0, x1, y1), spectre))
+
+            # Excel - лист на матрицу ROI, остальные форматы - матрицы одним массивом (ROI, каналы, каналы)
+            wavelengths = self.plot.hsi.wavelengths
+            bands = len(wavelengths)
+            arrays = {'roi': export.table(data_roi), 'mean_spectre': np.reshape(spectra, (-1, bands))}
+            if export.extension(save_path, selected) == '.xlsx':
+                arrays |= {f'matrix_{i}': matrix for i, matrix in enumerate(matrices)}
+            else:
+                arrays |= {'matrix': np.reshape(matrices, (-1, bands, bands)), 'wavelengths': np.asarray(wavelengths)}
+            self.save_tables(save_path, arrays, columns={'mean_spectre': wavelengths}, selected_filter=selected)
 
     def save_mode_2(self):
         save_path = QW.QFileDialog.getSaveFileName(self, "Save File", f'{self.input.text()}_mode_2', '.xlsx')
         if not save_path[0]: return
-        with pd.ExcelWriter(''.join(save_path), engine='openpyxl') as writer:
+        with profiler.timer('save_mode_2'), pd.ExcelWriter(''.join(save_path), engine='openpyxl') as writer:
             data = {'x': [], 'y': []} | {nm_i: [] for nm_i in self.plot.hsi.wavelengths}
             
             flex_lumen = self.plot.mode_object
@@ -245,6 +289,13 @@ class Interface(QW.QMainWindow):
 
             pd.DataFrame(data).to_excel(writer, sheet_name='spectre')
 
+    def save_tables(self, *args, **kwargs):
+        # Синхронное сохранение небольших таблиц; ошибки формата (Excel, pyarrow) - окном
+        try:
+            export.save(*args, **kwargs)
+        except (ValueError, ImportError) as error:
+            QW.QMessageBox.warning(self, 'Сохранение', str(error))
+
     def save(self):
         match self.plot.mode:
             case 1:
@@ -254,9 +305,73 @@ class Interface(QW.QMainWindow):
             case 3:
                 self.save_mode_3()
 
+    def toggle_profiler(self):
+        # Включить профилирование с индикатором FPS/задержек поверх изображения
+        profiler.enabled = not profiler.enabled
+        if profiler.enabled:
+            profiler.reset()
+            self.overlay = profiler.overlay(self.plot.fig)
+        elif hasattr(self, 'overlay'):
+            self.overlay.remove()
+            del self.overlay
+
+    def save_profile(self):
+        save_path = QW.QFileDialog.getSaveFileName(self, "Save File", 'profile', 'JSON (*.json);;CSV (*.csv)')
+        if not save_path[0]: return
+        profiler.dump(save_path[0])
+
+    def filter(self, masked: bool = False):
+        # Параметры фильтра: 'окно порядок [производная]'
+        text, ok = QW.QInputDialog.getText(self, 'Фильтр Савицкого-Голея', 'Окно, порядок, производная:', text='5 2 0')
+        if not ok: return
+        try:
+            window_length, polyorder, deriv = (list(map(int, text.split())) + [0])[:3]
+        except ValueError as error:
+            QW.QMessageBox.warning(self, 'Фильтр Савицкого-Голея', str(error))
+            return
+        self.refresh(partial(self.plot.hsi.savgol, window_length, polyorder, deriv, masked))
+
+    def rotate(self):
+        self.refresh(self.plot.hsi.rot)
+
     def parse(self):
+        self.debounce.stop()
+        self.refresh(expression=self.input.text())
+
+    def preview(self):
+        # Выражение во время ввода: сначала грубый кадр, затем полный расчет
         expression = self.input.text()
-        self.plot.redraw(expression)
+        if expression.strip(): self.refresh(expression=expression, preview=True)
+
+    def toggle_live(self):
+        self.live = not self.live
+        if not self.live: self.debounce.stop()
+
+    def closeEvent(self, event):
+        self.tasks.shutdown() # Незаконченное вычисление прерывается на ближайшем тайле
+        super().closeEvent(event)
+
+    def refresh(self, action: Callable[[], None] | None = None, expression: str | None = None, preview: bool = False):
+        # Изменение HSI (action) и пересчет канала в фоновом потоке. Новая задача отменяет незаконченную
+        # предыдущую, но action выполняется всегда: каждая задача пересчитывает текущее состояние,
+        # поэтому рисуется результат последней.
+        # preview - сначала показать подвыборку (каждый PREVIEW_STRIDE-й пиксель), ошибки незаконченного
+        # выражения не показываются окном, а пишутся в строку состояния
+        def job():
+            if action is not None: action()
+            if preview: Progress.current().publish(self.plot.hsi.preview(expression, self.PREVIEW_STRIDE))
+            self.plot.hsi.calculate_channel(expression)
+            return self.plot.frame()
+
+        def failed(error: str):
+            # Грубый кадр не должен остаться вместо канала
+            self.plot.restore()
+            if preview: self.statusBar().showMessage(error, 5000)
+            else: QW.QMessageBox.warning(self, 'Вычисление канала', error)
+
+        self.tasks.submit('Вычисление канала', job, lambda frame: self.plot.show(*frame),
+                          on_partial=(lambda frame: self.plot.preview(*frame)) if preview else None,
+                          on_error=failed, on_cancel=self.plot.restore, exclusive=True)
 
         
 def main():
@@ -5,11 +5,15 @@ from matplotlib.image import AxesImage
 import plotly.graph_objs as go
 
 from Data.hsi import HSI
+from Data.colorscale import ColorScale
+from Data.pyramid import PyramidView
 from Data.mean_sign import MeanSign
+from Data.profiler import profiler
 
 from Data.Interactive.lim_slice import LimSlice
 from Data.Interactive.flex_lumen import FlexLumen
 
+from Data.Interactive.Medium.Elementary.creator import Creator
 from Data.Interactive.Medium.Elementary.style import CMAP
 
 class Plot:
@@ -19,6 +23,10 @@ class Plot:
         self.create_axes()
         self._mode = 0
         self.hsi = HSI()
+        self.colorscale = ColorScale('sampled') # Границы цветовой шкалы (кэш по версии канала и маски)
+        self.channel_key = None
+        self.channel_mask = None
+        self.pixelwise = False # Режим матрицы ND в режиме 'Средний спектр'
 
     def create_axes(self):
         self.fig, self.ax_in = plt.subplots()
@@ -48,16 +56,64 @@ class Plot:
             divider = make_axes_locatable(self.ax_in)
             cax = divider.append_axes('bottom', size='5%', pad=.025)
             self.cb = self.fig.colorbar(self.channel, cax=cax, orientation='horizontal')
+
+            # Отображение через пирамиду уровней (исходное изображение остается в осях для режимов)
+            self.view = PyramidView(self.channel)
         else:
-            self.channel.set_data(img)
+            resized = self.channel.get_array().shape != img.shape
+            Creator.set_data(self.channel, img)
+            if resized: # Другой куб или поворот - показываем изображение целиком
+                h, w = img.shape[:2]
+                self.axes_in.set_xlim(-.5, w - .5)
+                self.axes_in.set_ylim(h - .5, -.5)
         
-        self.channel.set_clim(*np.percentile(img, (1, 99)))
+        self.channel.set_clim(*self.clim(img, self.channel_key, self.channel_mask))
+        # Пирамида строится по изображению в отображаемой ориентации: поворот не меняет ключ канала,
+        # поэтому ориентация входит в ключ пирамиды
+        orientation = self.hsi.orientation
+        self.view.set(img, None if self.channel_key is None else (self.channel_key, orientation.k, orientation.flipped))
+        self.title = f'${self.hsi.parser.latex_nm}$' # Подпись показанного канала (для restore)
+        self.axes_in.set_title(self.title)
+
+    @profiler.timed('clim')
+    def clim(self, img: np.ndarray[float], key: tuple | None = None, mask: np.ndarray[bool] | None = None) -> tuple[float, float]:
+        # Границы цветовой шкалы (по ключу канала берутся из кэша); общая для изображения и colorbar
+        return self.colorscale(img, key, mask)
+
+    def frame(self) -> tuple[np.ndarray[float], tuple | None, np.ndarray[bool]]:
+        # Подготовка кадра (можно в фоновом потоке): канал с зануленным фоном, его ключ и маска
+        key, mask = self.hsi.mask_channel_key, self.hsi.mask # Фон маски не влияет на шкалу
+        img = self.hsi.mask_channel
+        self.colorscale(img, key, mask) # Границы шкалы попадут в кэш
+        return img, key, mask
+
+    @profiler.timed('draw')
+    def draw(self, img: np.ndarray | None = None):
+        self.show(*(self.frame() if img is None else (img, None, None)))
+
+    def show(self, img: np.ndarray[float], key: tuple | None = None, mask: np.ndarray[bool] | None = None):
+        # Отрисовка готового кадра (поток GUI)
+        self.channel_key, self.channel_mask = key, mask
+        self.channel = img
+        self.draw_in()
+
+    @profiler.timed('preview')
+    def preview(self, img: np.ndarray[float], mask: np.ndarray[bool] | None = None):
+        # Грубый кадр (подвыборка) вместо канала до готовности полного расчета; данные режимов не меняются
+        self.channel.set_clim(*self.clim(img, None, mask))
+        self.view.preview(img)
         self.axes_in.set_title(f'${self.hsi.parser.latex_nm}$')
+        self.draw_in()
 
-    def draw(self, img: np.ndarray | None = None):
-        self.channel = self.hsi.mask_channel if img is None else img
+    def restore(self):
+        # Снять грубый кадр: вернуть последний показанный канал, его шкалу и подпись
+        if not hasattr(self, 'view') or not self.view.previewing: return
+        self.channel.set_clim(*self.clim(self.channel.get_array(), self.channel_key, self.channel_mask))
+        self.view.restore()
+        self.axes_in.set_title(self.title)
         self.draw_in()
 
+    @profiler.timed('canvas.draw')
     def draw_in(self):
         self.canvas.draw()
 
@@ -71,13 +127,11 @@ class Plot:
 
     ########################################
 
-    def rotate(self):
-        self.hsi.rot()
-        self.redraw()
-
-    def filter(self):
-        self.hsi.savgol()
-        self.redraw()
+    def toggle_pixelwise(self):
+        # Переключить матрицу ND: среднее по пикселям ROI / по среднему спектру
+        self.pixelwise = not self.pixelwise
+        if self.mode == 3:
+            self.mode_object.pixelwise = self.pixelwise
 
     def rgb(self):
         Plot.imshow(self.hsi.rgb)
@@ -141,7 +195,7 @@ class Plot:
 
             case 3:
                 # mean_sign
-                self.mode_object = MeanSign(self.hsi, self.ax_in)
+                self.mode_object = MeanSign(self.hsi, self.ax_in, pixelwise=self.pixelwise)
 
             case _:
                 return
@@ -0,0 +1,97 @@
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PyQt6.QtCore import QObject, pyqtSignal
+
+from Data.progress import Progress, Cancelled
+
+class Task(Progress):
+    # Фоновая задача: прогресс уходит сигналом TaskRunner.progress
+    def __init__(self, runner: 'TaskRunner', name: str, on_result: Callable[[object], None] | None,
+                 on_partial: Callable[[object], None] | None = None, on_error: Callable[[str], None] | None = None,
+                 on_cancel: Callable[[], None] | None = None, exclusive: bool = False):
+        super().__init__(lambda fraction: runner.progress.emit(name, fraction))
+        self.runner = runner
+        self.name = name
+        self.on_result = on_result
+        self.on_partial = on_partial # Промежуточные результаты (напр. грубый кадр до полного)
+        self.on_error = on_error # Вместо сигнала failed (напр. тихие ошибки незаконченного ввода)
+        self.on_cancel = on_cancel # Отмена без задачи-преемника (напр. при закрытии)
+        self.exclusive = exclusive # Задача меняет общие данные (HSI): интерактивные режимы блокируются
+
+    def publish(self, value: object):
+        # Рабочий поток: передать промежуточный результат в поток GUI
+        if self.cancelled: raise Cancelled()
+        self.runner._partial.emit(self, value)
+
+class TaskRunner(QObject):
+    # Выполнение тяжелых операций (загрузка, парсинг и вычисление индекса, фильтр, поворот) вне потока GUI.
+    # Один рабочий поток - операции над HSI идут по очереди; новая задача с тем же именем отменяет
+    # предыдущую (Progress), а результат применяется в потоке GUI только для последней задачи.
+    # Пока выполняется задача exclusive (меняет HSI), сигнал busy блокирует чтение HSI из потока GUI
+    progress = pyqtSignal(str, float) # имя задачи, доля 0..1
+    failed = pyqtSignal(str, str) # имя задачи, текст ошибки
+    running = pyqtSignal(bool) # есть ли незавершенные задачи
+    busy = pyqtSignal(bool) # есть ли незавершенные задачи, меняющие общие данные (exclusive)
+    _finished = pyqtSignal(object, object) # (Task, Future) из рабочего потока в поток GUI
+    _partial = pyqtSignal(object, object) # (Task, промежуточный результат)
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='tasks')
+        self.latest: dict[str, Task] = {} # имя -> последняя задача
+        self._finished.connect(self.finish)
+        self._partial.connect(self.partial)
+
+    def submit(self, name: str, function: Callable[..., object], on_result: Callable[[object], None] | None = None,
+               *args, on_partial: Callable[[object], None] | None = None, on_error: Callable[[str], None] | None = None,
+               on_cancel: Callable[[], None] | None = None, exclusive: bool = False, **kwargs) -> Task:
+        previous = self.latest.get(name)
+        if previous is not None: previous.cancel()
+
+        task = Task(self, name, on_result, on_partial, on_error, on_cancel, exclusive)
+        self.latest[name] = task
+        self.state()
+        future = self.executor.submit(self.run, task, function, *args, **kwargs)
+        future.add_done_callback(lambda future: self._finished.emit(task, future))
+        return task
+
+    @staticmethod
+    def run(task: Task, function: Callable[..., object], *args, **kwargs) -> object:
+        with task:
+            return function(*args, **kwargs)
+
+    def partial(self, task: Task, value: object):
+        # Поток GUI: промежуточный результат только последней неотмененной задачи
+        if self.latest.get(task.name) is not task or task.cancelled: return
+        if task.on_partial is not None: task.on_partial(value)
+
+    def state(self):
+        self.running.emit(bool(self.latest))
+        self.busy.emit(any(task.exclusive for task in self.latest.values()))
+
+    def finish(self, task: Task, future: Future):
+        # Поток GUI: результаты устаревших задач отбрасываются; режимы разблокируются после применения результата
+        if self.latest.get(task.name) is not task: return
+        del self.latest[task.name]
+        try:
+            self.apply(task, future)
+        finally:
+            self.state()
+
+    def apply(self, task: Task, future: Future):
+        # Future, отмененный до запуска (shutdown с cancel_futures), не имеет ни результата, ни исключения:
+        # exception() и result() бросили бы CancelledError в слоте Qt
+        error = None if future.cancelled() else future.exception()
+        if future.cancelled() or isinstance(error, Cancelled) or task.cancelled:
+            if task.on_cancel is not None: task.on_cancel()
+            return
+        if error is not None:
+            if task.on_error is not None: task.on_error(str(error))
+            else: self.failed.emit(task.name, str(error))
+            return
+        if task.on_result is not None: task.on_result(future.result())
+
+    def shutdown(self):
+        for task in self.latest.values(): task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)